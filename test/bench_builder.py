@@ -0,0 +1,23 @@
+import time
+import setpath
+import yem
+
+COUNT = 100000
+
+records = [dict(title="Chapter " + str(i), text="content of chapter " + str(i), level=1 + i % 2, words=i)
+           for i in range(COUNT)]
+
+start = time.perf_counter()
+book = yem.Book(title="Objects")
+for r in records:
+    ch = yem.Chapter(title=r["title"], text=yem.Text.for_string(r["text"]))
+    ch.words = r["words"]
+    if r["level"] == 1:
+        book.append(ch)
+    else:
+        book.chapter(-1).append(ch)
+print("per object: {0:.3f}s".format(time.perf_counter() - start))
+
+start = time.perf_counter()
+book = yem.Book.from_records(records, title="Records")
+print("from_records: {0:.3f}s".format(time.perf_counter() - start))
@@ -0,0 +1,103 @@
+import datetime
+import decimal
+import os
+import tempfile
+import unittest
+
+import yem
+
+
+class Point(object):
+    def __init__(self, x, y):
+        self.x = x
+        self.y = y
+
+    def __eq__(self, other):
+        return isinstance(other, Point) and (self.x, self.y) == (other.x, other.y)
+
+
+class LabeledPoint(Point):
+    pass
+
+
+yem.register_codec(Point, yem.Codec("point", lambda v, c, k: ("point", "{0},{1}".format(v.x, v.y)),
+                                    lambda n, p, t, c: Point(*map(int, t.split(",")))))
+
+
+def round_trip(value, key=None):
+    return yem.decode_value(*yem.encode_value(value), key=key)
+
+
+class CodecTest(unittest.TestCase):
+    def test_datetime(self):
+        value = datetime.datetime(2016, 3, 4, 5, 6, 7)
+        self.assertEqual(yem.encode_value(value), ("datetime;format=yyyy-M-d H:m:S", "2016-03-04 05:06:07"))
+        self.assertEqual(round_trip(value), value)
+
+    def test_date_and_time(self):
+        date = datetime.date(2016, 3, 4)
+        time = datetime.time(5, 6, 7)
+        self.assertEqual(yem.encode_value(date), ("datetime;format=yyyy-M-d", "2016-03-04"))
+        self.assertEqual(round_trip(date), date)
+        self.assertIs(type(round_trip(date)), datetime.date)
+        self.assertEqual(round_trip(time), time)
+
+    def test_bool_is_not_int(self):
+        self.assertEqual(yem.encode_value(True), ("bool", "true"))
+        self.assertIs(round_trip(False), False)
+        self.assertEqual(yem.encode_value(1), ("int", "1"))
+        self.assertIs(type(round_trip(1)), int)
+
+    def test_decimal(self):
+        self.assertEqual(yem.encode_value(decimal.Decimal("9.90")), ("real", "9.90"))
+        self.assertEqual(round_trip(decimal.Decimal("9.90")), 9.9)
+
+    def test_sequence_attribute(self):
+        self.assertEqual(yem.encode_value(("a", "b")), ("str", "a;b"))
+        self.assertEqual(round_trip(["a", "b"], "author"), ("a", "b"))
+        # only attributes allowing list are split
+        self.assertEqual(round_trip(("a", "b"), "title"), "a;b")
+        self.assertEqual(round_trip(("a",), "author"), "a")
+
+    def test_custom_codec(self):
+        self.assertEqual(yem.encode_value(Point(1, 2)), ("point", "1,2"))
+        # codec of the base class is found in MRO
+        self.assertIs(yem.get_codec(LabeledPoint), yem.get_codec(Point))
+        self.assertEqual(round_trip(LabeledPoint(3, 4)), Point(3, 4))
+
+    def test_unknown_type(self):
+        self.assertEqual(yem.encode_value(object())[0], "str")
+        self.assertRaises(yem.YemError, yem.decode_value, "unknown", "")
+
+
+class PmabCodecTest(unittest.TestCase):
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix=".pmab")
+        os.close(fd)
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def test_round_trip(self):
+        attributes = dict(title="Ex", author=("a", "b"), words=100, pubdate=datetime.datetime(2016, 3, 4, 5, 6, 7),
+                          released=datetime.date(2016, 3, 4), price=decimal.Decimal("9.90"), finished=True,
+                          origin=Point(1, 2), intro=yem.Text.for_string("intro of book"))
+        book = yem.Book()
+        book.update_attributes(attributes)
+        book.append(yem.Chapter(title="Chapter 1", text=yem.Text.for_string("hello world"), words=2))
+        yem.make_book(book, self.path)
+        book = yem.parse_book(self.path)
+        try:
+            expected = dict(attributes, price=9.9, intro="intro of book")
+            actual = {name: book.get_attribute(name) for name in attributes}
+            actual["intro"] = actual["intro"].text
+            self.assertEqual(actual, expected)
+            self.assertEqual(book[0].title, "Chapter 1")
+            self.assertEqual(book[0].words, 2)
+            self.assertEqual(book[0].text.text, "hello world")
+        finally:
+            book.cleanup()
+
+
+if __name__ == "__main__":
+    unittest.main()
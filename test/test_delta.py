@@ -0,0 +1,56 @@
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+import yem
+from yem import delta
+
+
+class DeltaTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.old = os.path.join(self.directory, "old.pmab")
+        self.new = os.path.join(self.directory, "new.pmab")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def make_book(self, chapters, path):
+        book = yem.Book(title="Ex")
+        for title, text in chapters:
+            book.append(yem.Chapter(title=title, text=yem.Text.for_string(text)))
+        yem.make_book(book, path, **{"pmab.deterministic": True})
+
+    def read(self, path):
+        with open(path, "rb") as fp:
+            return fp.read()
+
+    def test_apply_patch(self):
+        chapters = [("Chapter " + str(i), "text of chapter " + str(i)) for i in range(10)]
+        self.make_book(chapters, self.old)
+        chapters[3] = ("Chapter 3", "changed text")
+        chapters.insert(6, ("Inserted", "inserted text"))
+        del chapters[1]
+        self.make_book(chapters, self.new)
+        patch = os.path.join(self.directory, "patch.zip")
+        d = delta.diff(self.old, self.new, patch)
+        self.assertIn({"from": "1", "op": "remove"}, d.chapters)
+        self.assertIn("5", [c["path"] for c in d.chapters if c["op"] == "add"])
+        # unchanged chapters are not carried
+        self.assertLess(len(d.data), len(d.members))
+        out = os.path.join(self.directory, "out.pmab")
+        delta.apply_patch(self.old, patch, out)
+        self.assertEqual(self.read(out), self.read(self.new))
+
+    def test_mismatched_base(self):
+        self.make_book([("A", "a"), ("B", "b")], self.old)
+        self.make_book([("A", "a"), ("B", "c")], self.new)
+        d = delta.diff(self.old, self.new)
+        self.make_book([("X", "x"), ("Y", "y")], self.old)
+        self.assertRaises(yem.YemError, delta.apply_patch, self.old, d, io.BytesIO())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,46 @@
+import codecs
+import io
+import unittest
+
+import yem
+
+# long enough to be sampled at random positions
+TEXT = "第一章 开始\n这是一段用于检测编码的中文文本，包含标点符号。\nSome ASCII words too.\n" * 400
+
+
+class DetectEncodingTest(unittest.TestCase):
+    def detect(self, data):
+        encoding, confidence = yem.detect_encoding(data)
+        return codecs.lookup(encoding).name, confidence
+
+    def test_bom(self):
+        self.assertEqual(self.detect(codecs.BOM_UTF8 + TEXT.encode("utf-8")), ("utf-8-sig", 1.0))
+        self.assertEqual(self.detect(TEXT.encode("utf-16")), ("utf-16", 1.0))
+
+    def test_utf8(self):
+        encoding, confidence = self.detect(TEXT.encode("utf-8"))
+        self.assertEqual(encoding, "utf-8")
+        self.assertGreater(confidence, 0.9)
+
+    def test_utf16_without_bom(self):
+        self.assertEqual(self.detect(TEXT.encode("utf-16-le"))[0], "utf-16-le")
+        self.assertEqual(self.detect(TEXT.encode("utf-16-be"))[0], "utf-16-be")
+        self.assertEqual(self.detect("ASCII only text\n".encode("utf-16-le") * 100)[0], "utf-16-le")
+
+    def test_gb18030(self):
+        encoding, confidence = self.detect(TEXT.encode("gb18030"))
+        self.assertEqual(encoding, "gb18030")
+        self.assertGreater(confidence, 0.5)
+
+    def test_stream_position(self):
+        fp = io.BytesIO(TEXT.encode("gb18030"))
+        self.assertEqual(self.detect(fp)[0], "gb18030")
+        # stream is not consumed
+        self.assertEqual(fp.tell(), 0)
+
+    def test_empty(self):
+        self.assertEqual(yem.detect_encoding(b"")[1], 0.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
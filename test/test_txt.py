@@ -0,0 +1,62 @@
+import io
+import os
+import tempfile
+import unittest
+
+import yem
+from yem import txt
+
+CONTENT = "简介\n第一章 开始\n开始的内容\n\n第二章 继续\r\n继续的内容\n第十二回 结束\n最后"
+
+
+class ParseTest(unittest.TestCase):
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix=".txt")
+        os.close(fd)
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def parse(self, data, **kwargs):
+        with open(self.path, "wb") as fp:
+            fp.write(data)
+        return yem.parse_book(self.path, **kwargs)
+
+    def check_chapters(self, book):
+        try:
+            self.assertEqual(book.intro.text, "简介\n")
+            self.assertEqual([ch.title for ch in book], ["第一章 开始", "第二章 继续", "第十二回 结束"])
+            self.assertEqual([ch.text.text for ch in book], ["开始的内容\n\n", "继续的内容\n", "最后"])
+        finally:
+            book.cleanup()
+
+    def test_utf8(self):
+        self.check_chapters(self.parse(CONTENT.encode("utf-8")))
+
+    def test_utf8_with_bom(self):
+        self.check_chapters(self.parse(CONTENT.encode("utf-8-sig")))
+
+    def test_gbk(self):
+        self.check_chapters(self.parse(CONTENT.encode("gbk"), **{"txt.text.encoding": "gbk"}))
+
+    def test_detected_gb18030(self):
+        self.check_chapters(self.parse(CONTENT.encode("gb18030")))
+
+    def test_utf16(self):
+        self.check_chapters(self.parse(CONTENT.encode("utf-16")))
+
+    def test_stream(self):
+        book = txt.parse(io.BytesIO(CONTENT.encode("gbk")), **{"txt.text.encoding": "gbk"})
+        self.check_chapters(book)
+
+    def test_no_heading(self):
+        book = self.parse("没有章节\n".encode("utf-8"))
+        try:
+            self.assertEqual(len(book), 0)
+            self.assertEqual(book.text.text, "没有章节\n")
+        finally:
+            book.cleanup()
+
+
+if __name__ == "__main__":
+    unittest.main()
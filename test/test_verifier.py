@@ -0,0 +1,66 @@
+import os
+import struct
+import tempfile
+import unittest
+import zipfile
+
+import yem
+from yem import pmab
+
+
+class VerifyTest(unittest.TestCase):
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix=".pmab")
+        os.close(fd)
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def test_text_attribute_of_chapter(self):
+        b = yem.Book(title="Ex")
+        for i in range(3):
+            b.append(yem.Chapter(title="Chapter " + str(i), text=yem.Text.for_string("hello world")))
+        b[1].intro = yem.Text.for_string("intro of chapter")
+        yem.make_book(b, self.path)
+        report = pmab.verify(self.path)
+        self.assertTrue(report["ok"], report["errors"])
+        self.assertEqual(report["chapters"], 3)
+
+    def make_chapters(self):
+        b = yem.Book(title="Ex")
+        for i in range(2):
+            b.append(yem.Chapter(title="Chapter " + str(i), text=yem.Text.for_string("hello world")))
+        yem.make_book(b, self.path)
+
+    def test_missing_chapter_text(self):
+        self.make_chapters()
+        # copy all members except text of the first chapter
+        with zipfile.ZipFile(self.path) as zf:
+            infos = zf.infolist()
+            members = [(info, zf.read(info)) for info in infos if info.filename != "text/chapter-1.txt"]
+        self.assertEqual(len(members) + 1, len(infos))
+        with zipfile.ZipFile(self.path, "w") as zf:
+            for info, data in members:
+                zf.writestr(info, data)
+        report = pmab.verify(self.path)
+        self.assertFalse(report["ok"])
+        self.assertIn("missing member: text/chapter-1.txt", report["errors"])
+
+    def test_corrupted_mime_type(self):
+        self.make_chapters()
+        with zipfile.ZipFile(self.path) as zf:
+            info = zf.getinfo("mimetype")
+        with open(self.path, "rb") as fp:
+            data = bytearray(fp.read())
+        # flip a bit in the middle of member data after the local file header
+        name_size, extra_size = struct.unpack_from("<HH", data, info.header_offset + 26)
+        data[info.header_offset + 30 + name_size + extra_size + info.compress_size // 2] ^= 0x80
+        with open(self.path, "wb") as fp:
+            fp.write(data)
+        report = pmab.verify(self.path)
+        self.assertFalse(report["ok"])
+        self.assertTrue(any(e.startswith("bad member: mimetype") for e in report["errors"]), report["errors"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -23,6 +23,7 @@ The powerful e-book processing toolkit
 
 from .core import *
 from .utils import *
+from .delta import *
 from . import version
 
 __version__ = version.VERSION
@@ -33,3 +34,4 @@ __copyright__ = version.RIGHTS
 __all__ = dir()
 __all__.remove("utils")
 __all__.remove("core")
+__all__.remove("delta")
@@ -0,0 +1,164 @@
+#
+# Copyright 2014-2016 Peng Wan <phylame@163.com>
+#
+# This file is part of Yem.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""Raw members of ZIP archives and the build cache"""
+
+import os
+import zlib
+import time
+import struct
+import hashlib
+import tempfile
+import zipfile
+from . import version
+
+__version__ = version.VERSION
+__author__ = version.AUTHOR
+del version
+
+# fixed time of members in deterministic archive, the earliest time of ZIP
+EPOCH_TIME = (1980, 1, 1, 0, 0, 0)
+
+
+def fixed_time() -> tuple:
+    """Returns time for members of deterministic archive, from `SOURCE_DATE_EPOCH` if specified."""
+
+    epoch = os.environ.get("SOURCE_DATE_EPOCH")
+    if epoch:
+        return max(EPOCH_TIME, time.gmtime(int(epoch))[:6])
+    return EPOCH_TIME
+
+_LOCAL_HEADER = struct.Struct("<4s5H3L2H")
+# CRC and size of data, size and CRC of compressed bytes
+_CACHE_HEADER = struct.Struct("<LQQL")
+
+
+def compress(data: bytes, compression=zipfile.ZIP_DEFLATED, level=None) -> tuple:
+    """Compresses `data` for ZIP member, returns tuple of CRC, size and compressed bytes."""
+
+    if compression == zipfile.ZIP_STORED:
+        raw = data
+    elif compression == zipfile.ZIP_DEFLATED:
+        c = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION if level is None else level, zlib.DEFLATED, -15)
+        raw = c.compress(data) + c.flush()
+    else:
+        raise ValueError("unsupported compression: {0}".format(compression))
+    return zlib.crc32(data) & 0xFFFFFFFF, len(data), raw
+
+
+def write_raw(zf, zinfo, crc, size, raw):
+    """Writes compressed member to `zf`, `raw` must be compressed with `zinfo.compress_type`."""
+
+    if not zf.fp:
+        raise ValueError("Attempt to write to ZIP archive that was already closed")
+    if zf._writing:
+        raise ValueError("Can't write to ZIP archive while an open writing handle exists")
+    zinfo.CRC = crc
+    zinfo.file_size = size
+    zinfo.compress_size = len(raw)
+    zinfo.flag_bits = 0
+    if not zinfo.external_attr:
+        zinfo.external_attr = 0o600 << 16
+    zip64 = size > zipfile.ZIP64_LIMIT or len(raw) > zipfile.ZIP64_LIMIT
+    with zf._lock:
+        if zf._seekable:
+            zf.fp.seek(zf.start_dir)
+        zinfo.header_offset = zf.fp.tell()
+        zf._writecheck(zinfo)
+        zf._didModify = True
+        zf.fp.write(zinfo.FileHeader(zip64))
+        zf.fp.write(raw)
+        zf.start_dir = zf.fp.tell()
+        zf.filelist.append(zinfo)
+        zf.NameToInfo[zinfo.filename] = zinfo
+
+
+def read_raw(zf, zinfo, start=0, size=None) -> bytes:
+    """Reads compressed bytes of member `zinfo` in `zf` without decompressing.
+
+    Only `size` bytes from offset `start` are read if specified, the data itself for stored member.
+    """
+
+    with zf._lock:
+        zf.fp.seek(zinfo.header_offset)
+        header = _LOCAL_HEADER.unpack(zf.fp.read(_LOCAL_HEADER.size))
+        if header[0] != zipfile.stringFileHeader:
+            raise zipfile.BadZipFile("Bad magic number for file header")
+        zf.fp.seek(header[-2] + header[-1] + start, os.SEEK_CUR)
+        rest = max(0, zinfo.compress_size - start)
+        return zf.fp.read(rest if size is None else min(size, rest))
+
+
+class BuildCache(object):
+    """On-disk cache of compressed members keyed by digest of content and compression settings."""
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    @staticmethod
+    def key(data, compression, level):
+        h = hashlib.sha256(data)
+        h.update("/{0}/{1}".format(compression, level).encode("ascii"))
+        return h.hexdigest()
+
+    def _path_(self, key):
+        return os.path.join(self.directory, key[:2], key[2:])
+
+    def get(self, key):
+        """Returns tuple of CRC, size and compressed bytes, or `None` if not cached or the entry is damaged."""
+
+        try:
+            with open(self._path_(key), "rb") as fp:
+                b = fp.read()
+        except FileNotFoundError:
+            return None
+        try:
+            crc, size, raw_size, raw_crc = _CACHE_HEADER.unpack_from(b)
+        except struct.error:
+            # truncated entry
+            return None
+        raw = b[_CACHE_HEADER.size:]
+        # entry of old format or damaged, compressed again by caller
+        if len(raw) != raw_size or zlib.crc32(raw) & 0xFFFFFFFF != raw_crc:
+            return None
+        return crc, size, raw
+
+    def put(self, key, entry):
+        path = self._path_(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+        try:
+            with os.fdopen(fd, "wb") as fp:
+                fp.write(_CACHE_HEADER.pack(entry[0], entry[1], len(entry[2]), zlib.crc32(entry[2]) & 0xFFFFFFFF))
+                fp.write(entry[2])
+            os.replace(tmp, path)
+        except:
+            os.remove(tmp)
+            raise
+
+    def compress(self, data, compression=zipfile.ZIP_DEFLATED, level=None):
+        """Returns compressed entry of `data` from cache, or compresses and caches it."""
+
+        key = self.key(data, compression, level)
+        entry = self.get(key)
+        if entry is None:
+            entry = compress(data, compression, level)
+            self.put(key, entry)
+        return entry
+
+
+__all__ = ["BuildCache"]
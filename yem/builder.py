@@ -0,0 +1,196 @@
+#
+# Copyright 2014-2016 Peng Wan <phylame@163.com>
+#
+# This file is part of Yem.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""Bulk building of books from records"""
+
+import gc
+import csv
+import json
+import datetime
+from .core import *
+from .utils import *
+from .utils import _RawText
+from . import version
+
+__version__ = version.VERSION
+__author__ = version.AUTHOR
+del version
+
+# field for content of chapter
+TEXT = "text"
+# field for depth of chapter, 1 for chapters of the book
+LEVEL = "level"
+
+BATCH_SIZE = 1024
+
+
+class BookBuilder(object):
+    """Builds chapter tree from records(dicts) in one pass.
+
+    `schema` maps record field to attribute name or tuple of name and converter,
+    fields not in schema are ignored. Without schema, all fields are attributes.
+    Field `text` is the content and `level` the depth of chapter. Values are
+    type-checked per batch of `batch_size` records.
+
+    With `pause_gc`, the garbage collector is disabled while building each batch,
+    which is faster for large trees but affects all threads of the process.
+    """
+
+    def __init__(self, book=None, schema=None, batch_size=BATCH_SIZE, text_type=Text.PLAIN, pause_gc=False):
+        self.book = book if book is not None else Book()
+        self.schema = None if schema is None else dict(
+            (k, v if isinstance(v, tuple) else (v, None)) for k, v in schema.items())
+        self.batch_size = batch_size
+        self.text_type = text_type
+        self.pause_gc = pause_gc
+        self.__batch = []
+        # children lists of the current path
+        self.__stack = [self.book._children_()]
+        self.__count = 0
+
+    def add(self, record):
+        self.__batch.append(record)
+        if len(self.__batch) >= self.batch_size:
+            self.flush()
+
+    def extend(self, records):
+        for record in records:
+            self.add(record)
+
+    def flush(self):
+        batch, self.__batch = self.__batch, []
+        if not batch:
+            return
+        if not self.pause_gc:
+            self.__build(batch)
+            return
+        # no garbage is created, collecting for new objects is useless
+        enabled = gc.isenabled()
+        gc.disable()
+        try:
+            self.__build(batch)
+        finally:
+            if enabled:
+                gc.enable()
+
+    def __build(self, batch):
+        rows = [self.map_record(record) for record in batch]
+        self.check(rows)
+        stack = self.__stack
+        text_type = non_empty(self.text_type, "text_type")
+        create_chapter = Chapter._create_
+        create_text = _RawText._create_
+        for attributes in rows:
+            text = attributes.pop(TEXT, None)
+            level = attributes.pop(LEVEL, 1)
+            if level < 1 or level > len(stack):
+                raise ValueError("record {0}: bad level {1}".format(self.__count, level))
+            if text.__class__ is str:
+                text = create_text(text, text_type)
+            children = []
+            del stack[level:]
+            stack[-1].append(create_chapter(attributes, text, children))
+            stack.append(children)
+            self.__count += 1
+
+    def map_record(self, record):
+        if self.schema is None:
+            # missing values like the schema path, attributes are never None
+            return {k: v for k, v in record.items() if v is not None}
+        attributes = {}
+        for field, (name, converter) in self.schema.items():
+            value = record.get(field)
+            if value is not None:
+                attributes[name] = converter(value) if converter else value
+        return attributes
+
+    def check(self, rows):
+        """Checks types of values by columns."""
+
+        names = set()
+        for attributes in rows:
+            names.update(attributes)
+        for name in names:
+            if name == TEXT:
+                types = (Text, str)
+            elif name == LEVEL:
+                types = int
+            else:
+                attr = Chapter.attributes.get(name)
+                if attr is None:
+                    continue
+                types = attr[0]
+            column = [attributes.get(name) for attributes in rows]
+            if not all(v is None or isinstance(v, types) for v in column):
+                for i, v in enumerate(column):
+                    if v is not None and not isinstance(v, types):
+                        raise TypeError("record {0}: '{1}' require '{2}' object".format(
+                            self.__count + i, name, class_name(types) if isinstance(types, type) else types))
+
+    def build(self):
+        self.flush()
+        return self.book
+
+
+def read_jsonl(fp):
+    """Yields records of JSON lines in text stream `fp`."""
+
+    for line in fp:
+        if line.strip():
+            yield json.loads(line)
+
+
+def read_csv(fp, converters=None, **kwargs):
+    """Yields records of CSV with header in text stream `fp`, empty values are omitted.
+
+    `converters` maps field to function converting the text, by default `level` and
+    registered attributes of numbers, dates and lists are converted, see `csv_converter`.
+    """
+
+    reader = csv.DictReader(fp, **kwargs)
+    if converters is None:
+        converters = {}
+        for field in reader.fieldnames or ():
+            converter = csv_converter(field)
+            if converter is not None:
+                converters[field] = converter
+    for row in reader:
+        yield dict((k, converters[k](v) if k in converters else v) for k, v in row.items() if v != "")
+
+
+def csv_converter(name):
+    """Returns function converting CSV text to type of attribute `name`, or `None` for text."""
+
+    if name == LEVEL:
+        return int
+    attr = Chapter.attributes.get(name)
+    if attr is None:
+        return None
+    types = attr[0] if isinstance(attr[0], tuple) else (attr[0],)
+    if int in types:
+        return int
+    elif float in types:
+        return float
+    elif datetime.datetime in types:
+        return datetime.datetime.fromisoformat
+    elif list in types or tuple in types:
+        # like values decoded from PMAB
+        return lambda v: tuple(v.split(";")) if ";" in v else v
+    return None
+
+
+__all__ = ["BookBuilder"]
@@ -0,0 +1,249 @@
+#
+# Copyright 2014-2016 Peng Wan <phylame@163.com>
+#
+# This file is part of Yem.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""Columnar export of book attributes for analysis"""
+
+import sys
+import json
+import array
+import struct
+import decimal
+import datetime
+import concurrent.futures
+from . import core
+from .core import *
+from . import values, version
+
+__version__ = version.VERSION
+__author__ = version.AUTHOR
+del version
+
+# kinds of columns, missing value is `MISSING_INT`
+INT = "int"
+# missing value is NaN
+FLOAT = "float"
+# seconds since the epoch, missing value is NaN
+DATE = "date"
+# strings encoded as indexes of categories, missing value is -1
+CATEGORY = "category"
+
+TYPECODES = {INT: "q", FLOAT: "d", DATE: "d", CATEGORY: "i"}
+
+# the smallest 64-bit integer, not a valid count of words or pages
+MISSING_INT = -1 << 63
+
+# kinds of attributes, others are exported as categories
+KINDS = {"words": INT, "pages": INT, "price": FLOAT, "pubdate": DATE, "date": DATE}
+
+# known categories are numbered first, so codes are stable between exports
+CATEGORIES = {"genre": values.GENRES, "state": values.STATES}
+
+FIELDS = ("words", "genre", "state", "price", "pubdate")
+
+MAGIC = b"YCOL"
+_HEADER = struct.Struct("<4sBxxxQ")
+# alignment of column buffers in the file
+ALIGNMENT = 8
+
+
+class Columns(object):
+    """Attributes of books as typed arrays, one row per book.
+
+    Each column is an `array.array` usable as buffer, e.g. `numpy.frombuffer(columns["words"], "q")`.
+    Missing values are `MISSING_INT` for INT, NaN for FLOAT and DATE, and -1 for CATEGORY columns.
+    """
+
+    def __init__(self, paths, data, categories, errors=None):
+        self.paths = paths
+        self.data = data
+        self.categories = categories
+        # row index to error message of books failed to read
+        self.errors = errors or {}
+
+    @property
+    def names(self):
+        return list(self.data)
+
+    def kind(self, name):
+        return KINDS.get(name, CATEGORY)
+
+    def decode(self, name):
+        """Returns values of category column `name` as strings, `None` for missing values."""
+
+        categories = self.categories[name]
+        return [categories[code] if code >= 0 else None for code in self.data[name]]
+
+    def save(self, file):
+        """Writes columns to binary `file` or path, see `load_columns`."""
+
+        if isinstance(file, str):
+            with open(file, "wb") as fp:
+                return self.save(fp)
+        columns = []
+        offset = 0
+        for name, column in self.data.items():
+            size = len(column) * column.itemsize
+            columns.append({"name": name, "kind": self.kind(name), "typecode": column.typecode,
+                            "offset": offset, "size": size, "categories": self.categories.get(name)})
+            offset += _padded(size)
+        header = json.dumps({"rows": len(self.paths), "byteorder": sys.byteorder, "paths": self.paths,
+                             "errors": self.errors, "columns": columns}, ensure_ascii=False).encode("utf-8")
+        file.write(_HEADER.pack(MAGIC, 1, len(header)))
+        file.write(header)
+        file.write(bytes(_padded(_HEADER.size + len(header)) - _HEADER.size - len(header)))
+        for column in self.data.values():
+            b = column.tobytes()
+            file.write(b)
+            file.write(bytes(_padded(len(b)) - len(b)))
+
+    def __getitem__(self, name):
+        return self.data[name]
+
+    def __len__(self):
+        return len(self.paths)
+
+    def __repr__(self):
+        return "Columns@{0}:rows={1},columns={2}".format(id(self), len(self.paths), self.names)
+
+
+def _padded(size):
+    return (size + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def load_columns(file):
+    """Reads `Columns` saved by `Columns.save` from binary `file` or path."""
+
+    if isinstance(file, str):
+        with open(file, "rb") as fp:
+            return load_columns(fp)
+    magic, version, size = _HEADER.unpack(file.read(_HEADER.size))
+    if magic != MAGIC:
+        raise YemError("not columns file")
+    if version != 1:
+        raise YemError("unsupported columns version: {0}".format(version))
+    header = json.loads(file.read(size).decode("utf-8"))
+    # buffers are read at once after aligned header
+    body = file.read()[_padded(_HEADER.size + size) - _HEADER.size - size:]
+    data = {}
+    categories = {}
+    for column in header["columns"]:
+        a = array.array(column["typecode"])
+        a.frombytes(body[column["offset"]:column["offset"] + column["size"]])
+        if header["byteorder"] != sys.byteorder:
+            a.byteswap()
+        data[column["name"]] = a
+        if column["categories"] is not None:
+            categories[column["name"]] = column["categories"]
+    return Columns(header["paths"], data, categories, {int(k): v for k, v in header["errors"].items()})
+
+
+def read_attributes(path, names):
+    """Reads attributes `names` of book in `path`, only metadata is read for PMAB."""
+
+    if path.lower().endswith(".pmab"):
+        from yem import pmab
+        return pmab.parse_attributes(path, names)
+    book = core.parse_book(path)
+    try:
+        return {name: book.get_attribute(name) for name in names if book.has_attribute(name)}
+    finally:
+        book.cleanup()
+
+
+def _read_rows(paths, names):
+    # runs in worker process, errors are returned to keep the batch
+    rows = []
+    for path in paths:
+        try:
+            rows.append((read_attributes(path, names), None))
+        except Exception as e:
+            rows.append((None, "failed: {0!r}".format(e)))
+    return rows
+
+
+def export_attributes(paths, names=FIELDS, workers=None, batch_size=64):
+    """Reads attributes `names` of many books with a process pool, returns `Columns`.
+
+    Books are read in batches of `batch_size` to reduce overhead of processes,
+    `workers` of 0 reads all in current process.
+    """
+
+    paths = list(paths)
+    names = tuple(names)
+    batches = [paths[i:i + batch_size] for i in range(0, len(paths), batch_size)]
+    if workers == 0:
+        results = (_read_rows(batch, names) for batch in batches)
+    else:
+        executor = concurrent.futures.ProcessPoolExecutor(workers)
+        results = executor.map(_read_rows, batches, [names] * len(batches))
+    builders = [_ColumnBuilder(name) for name in names]
+    errors = {}
+    row = 0
+    try:
+        for rows in results:
+            for attributes, error in rows:
+                if error is not None:
+                    errors[row] = error
+                row += 1
+                for builder in builders:
+                    builder.add(attributes.get(builder.name) if attributes is not None else None)
+    finally:
+        if workers != 0:
+            executor.shutdown()
+    return Columns(paths, {b.name: b.data for b in builders},
+                   {b.name: b.categories for b in builders if b.kind == CATEGORY}, errors)
+
+
+class _ColumnBuilder(object):
+    def __init__(self, name):
+        self.name = name
+        self.kind = KINDS.get(name, CATEGORY)
+        self.data = array.array(TYPECODES[self.kind])
+        if self.kind == CATEGORY:
+            self.categories = list(CATEGORIES.get(name, ()))
+            self.codes = {c: i for i, c in enumerate(self.categories)}
+
+    def add(self, value):
+        if self.kind == INT:
+            self.data.append(int(value) if value is not None else MISSING_INT)
+        elif self.kind == FLOAT:
+            self.data.append(float(value) if value is not None else float("nan"))
+        elif self.kind == DATE:
+            self.data.append(_timestamp(value))
+        elif value is None:
+            self.data.append(-1)
+        else:
+            value = str(value)
+            code = self.codes.get(value)
+            if code is None:
+                code = self.codes[value] = len(self.categories)
+                self.categories.append(value)
+            self.data.append(code)
+
+
+def _timestamp(value):
+    if isinstance(value, datetime.datetime):
+        return value.timestamp()
+    elif isinstance(value, datetime.date):
+        return datetime.datetime(value.year, value.month, value.day).timestamp()
+    elif isinstance(value, (int, float, decimal.Decimal)):
+        return float(value)
+    return float("nan")
+
+
+__all__ = ["Columns", "export_attributes", "load_columns", "MISSING_INT"]
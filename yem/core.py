@@ -18,9 +18,15 @@
 """Core components of Yem"""
 
 import os
+import shutil
 import decimal
+import collections
+import tempfile
+import contextlib
 import datetime
+import threading
 import traceback
+import concurrent.futures
 from .utils import *
 from . import values
 from . import version
@@ -44,6 +50,8 @@ class Chapter(object):
         "keywords": ((str, list, tuple), values.keywords),
         "vendor": (str, values.vendor),
         "words": (int, values.words),
+        "characters": (int, values.characters),
+        "paragraphs": (int, values.paragraphs),
         "genre": (str, values.genre),
         "state": (str, values.state),
         "publisher": (str, values.pubdate),
@@ -64,12 +72,56 @@ class Chapter(object):
         self.__attributes = {}
         self.__text = None
         self.__children = []
+        # chapters to be derived as children of a view
+        self.__source = None
         self.__cleanups = set()
         self.text = text
         self.update_attributes(**kwargs)
         if isinstance(self, Book):
             values.reset(self)
 
+    @staticmethod
+    def _create_(attributes, text, children):
+        """Creates chapter owning `attributes` dict and `children` list without checking, for bulk building."""
+
+        chapter = Chapter.__new__(Chapter)
+        object.__setattr__(chapter, "__dict__", dict(_Chapter__attributes=attributes, _Chapter__text=text,
+                                                     _Chapter__children=children, _Chapter__source=None,
+                                                     _Chapter__cleanups=set()))
+        return chapter
+
+    def _children_(self):
+        return self.__kids()
+
+    def __kids(self):
+        if self.__source is not None:
+            self.__children = [c.derive() for c in self.__source]
+            self.__source = None
+        return self.__children
+
+    def derive(self, cls=None):
+        """Returns a view sharing content of this chapter.
+
+        Attributes of the view are layered over attributes of this chapter, and
+        sub-chapters are derived when first accessed. Texts and files are shared
+        without reading. Changes of the view never affect this chapter, while
+        attributes not overridden follow it.
+        """
+
+        view = (cls or self.__class__).__new__(cls or self.__class__)
+        object.__setattr__(view, "__dict__", dict(_Chapter__attributes=collections.ChainMap({}, self.__attributes),
+                                                  _Chapter__text=self.__text, _Chapter__children=None,
+                                                  _Chapter__source=list(self.__kids()), _Chapter__cleanups=set()))
+        return view
+
+    def _layer_(self, *chapters):
+        """Puts attributes of `chapters` under attributes of this chapter."""
+        self.__attributes = collections.ChainMap(self.__attributes, *(c.__attributes for c in chapters))
+
+    def _set_children_(self, chapters):
+        self.__children = [c.derive() for c in chapters]
+        self.__source = None
+
     def set_attribute(self, name, value):
         # if has attribute setting
         attr = Chapter.attributes.get(non_empty(name, "name"))
@@ -93,10 +145,13 @@ class Chapter(object):
         return self.__attributes.get(name, attr[1] if default is None and attr else default)
 
     def remove_attribute(self, name):
+        if isinstance(self.__attributes, collections.ChainMap) and any(name in m for m in self.__attributes.maps[1:]):
+            # inherited or overridden, popping the top layer only would expose value of the layers
+            self.__attributes = dict(self.__attributes)
         return self.__attributes.pop(name)
 
     def clear_attributes(self):
-        self.__attributes.clear()
+        self.__attributes = {}
 
     @property
     def attribute_count(self):
@@ -126,30 +181,30 @@ class Chapter(object):
         return with_type(chapter, Chapter, "chapter")
 
     def append(self, chapter):
-        self.__children.append(Chapter._check_chapter_(chapter))
+        self.__kids().append(Chapter._check_chapter_(chapter))
 
     def insert(self, index, chapter):
-        self.__children.insert(index, Chapter._check_chapter_(chapter))
+        self.__kids().insert(index, Chapter._check_chapter_(chapter))
 
     def remove(self, obj):
         if isinstance(obj, int):
-            return self.__children.pop(obj)
+            return self.__kids().pop(obj)
         elif isinstance(obj, Chapter):
-            self.__children.remove(obj)
+            self.__kids().remove(obj)
         else:
             raise TypeError("index or '{0}' expected".format(class_name(Chapter)))
 
     def index(self, chapter):
-        return self.__children.index(Chapter._check_chapter_(chapter))
+        return self.__kids().index(Chapter._check_chapter_(chapter))
 
     def chapter(self, index):
-        return self.__children[index]
+        return self.__kids()[index]
 
     def replace(self, index, chapter):
-        self.__children[index] = Chapter._check_chapter_(chapter)
+        self.__kids()[index] = Chapter._check_chapter_(chapter)
 
     def clear(self):
-        self.__children.clear()
+        self.__kids().clear()
 
     @property
     def size(self):
@@ -175,13 +230,13 @@ class Chapter(object):
             work()
 
     def __repr__(self):
-        return "{0}@{1}:attributes={2}".format(class_name(self.__class__), id(self), self.__attributes)
+        return "{0}@{1}:attributes={2}".format(class_name(self.__class__), id(self), dict(self.__attributes))
 
     def __len__(self):
-        return len(self.__children)
+        return len(self.__kids())
 
     def __iter__(self):
-        return iter(self.__children)
+        return iter(self.__kids())
 
     def __getattribute__(self, item):
         # a registered attribute
@@ -233,10 +288,12 @@ class Book(Chapter):
         return self.__extensions.get(key, default)
 
     def remove_extension(self, key):
+        if isinstance(self.__extensions, collections.ChainMap) and any(key in m for m in self.__extensions.maps[1:]):
+            self.__extensions = dict(self.__extensions)
         return self.__extensions.pop(key)
 
     def clear_extensions(self):
-        self.__extensions.clear()
+        self.__extensions = {}
 
     @property
     def extension_count(self):
@@ -250,9 +307,221 @@ class Book(Chapter):
     def extension_items(self):
         return self.__extensions.items()
 
+    @staticmethod
+    def from_records(records, schema=None, **kwargs):
+        """Creates book with chapters from iterable of dict records, see `yem.builder.BookBuilder`."""
+
+        from .builder import BookBuilder
+        builder = BookBuilder(Book(**kwargs), schema)
+        builder.extend(records)
+        return builder.build()
+
+    def compute_statistics(self, workers=None, cache=None):
+        """Counts words, CJK characters and paragraphs of all chapters.
+
+        Sets `words`, `characters` and `paragraphs` of the book and each chapter, results of unchanged texts
+        are reused from `cache`(the shared cache by default).
+        """
+
+        from . import stats
+        return stats.compute(self, stats.WORKERS if workers is None else workers,
+                             stats.cache if cache is None else cache)
+
+    def derive(self, cls=None):
+        view = super(Book, self).derive(cls)
+        if isinstance(view, Book):
+            # extensions are shared like attributes
+            view.__extensions = collections.ChainMap({}, self.__extensions)
+        return view
+
+    def _layer_extensions_(self, *books):
+        self.__extensions = collections.ChainMap(self.__extensions, *(b.__extensions for b in books))
+
+    def split(self, by):
+        """Splits top-level chapters to volumes sharing content with this book, see `Chapter.derive`.
+
+        `by` is number of chapters of each volume, list of start indexes of volumes,
+        function returning `True` if a volume starts with the chapter, or `"section"`
+        to make each top-level chapter a volume with its attributes layered over the book.
+        """
+
+        if by == "section":
+            volumes = []
+            for section in self:
+                volume = section.derive(Book)
+                volume._layer_(self)
+                volume.__extensions = collections.ChainMap({}, self.__extensions)
+                volumes.append(volume)
+            return volumes
+        chapters = list(self)
+        if isinstance(by, int):
+            if by < 1:
+                raise ValueError("'by' require positive number")
+            starts = range(0, len(chapters), by)
+        elif callable(by):
+            starts = [i for i, ch in enumerate(chapters) if i == 0 or by(ch)]
+        else:
+            by = set(by)
+            for i in by:
+                if not isinstance(i, int) or not 0 <= i < len(chapters):
+                    raise ValueError("start index of volume out of range: {0!r}".format(i))
+            starts = sorted(by | {0})
+        bounds = list(starts) + [len(chapters)]
+        volumes = []
+        for start, end in zip(bounds, bounds[1:]):
+            volume = self.derive()
+            volume._set_children_(chapters[start:end])
+            volumes.append(volume)
+        return volumes
+
     def __repr__(self):
-        return super(Book, self).__repr__() + ",extensions={0}".format(self.__extensions)
+        return super(Book, self).__repr__() + ",extensions={0}".format(dict(self.__extensions))
+
+
+class Codec(object):
+    """Converts attribute values of some type to text and back.
+
+    `encode(value, context, key)` returns tuple of type name and text, `decode(type, params, text, context)`
+    returns the value. `context` is given by makers and parsers for storing `Text` and `File` values.
+    """
+
+    def __init__(self, name, encode, decode=None):
+        self.name = non_empty(name, "name")
+        self.encode = encode
+        self.decode = decode
+
+    def __repr__(self):
+        return "{0}:{1}".format(class_name(self.__class__), self.name)
+
+
+# codecs by exact type
+_codecs = {}
+# resolved codecs of types, including subclasses of registered types
+_codec_cache = {}
+# codecs for decoding by name
+_named_codecs = {}
+
+
+def register_codec(type, codec):
+    """Registers `codec` for values of `type` and its subclasses."""
 
+    _codecs[type] = with_type(codec, Codec, "codec")
+    _codec_cache.clear()
+    if codec.decode is not None:
+        _named_codecs[codec.name] = codec
+
+
+def get_codec(type):
+    """Returns codec of `type` by the nearest registered type in MRO, or `None` if not found."""
+
+    try:
+        return _codec_cache[type]
+    except KeyError:
+        pass
+    codec = None
+    for t in type.__mro__:
+        codec = _codecs.get(t)
+        if codec is not None:
+            break
+    _codec_cache[type] = codec
+    return codec
+
+
+def encode_value(value, context=None, key=None):
+    """Returns tuple of type name and text of `value`, values of unknown type are encoded as `str`."""
+
+    codec = _codec_cache.get(value.__class__) or get_codec(value.__class__) or _codecs[str]
+    return codec.encode(value, context, key)
+
+
+def decode_value(type, text, context=None, key=None):
+    """Returns value of `text` with type name like `datetime;format=yyyy-M-d`.
+
+    Values of attribute `key` allowing list or tuple are split by `;` into tuple.
+    """
+
+    name, params = parse_type(type)
+    codec = _named_codecs.get(name)
+    if codec is None:
+        if name.startswith("text/") and "encoding" in params:
+            codec = _named_codecs["text"]
+        elif "/" in name:
+            codec = _named_codecs["file"]
+        else:
+            raise YemError("unknown type: " + type)
+    value = codec.decode(name, params, text, context)
+    if key is not None and isinstance(value, str) and ";" in value and _is_sequence_attribute(key):
+        return tuple(value.split(";"))
+    return value
+
+
+def _is_sequence_attribute(key):
+    attr = Chapter.attributes.get(key)
+    if attr is None:
+        return False
+    types = attr[0] if isinstance(attr[0], tuple) else (attr[0],)
+    return list in types or tuple in types
+
+
+def parse_type(type):
+    """Splits type like `text/plain;encoding=UTF-8` into name and dict of parameters."""
+
+    name, _, rest = type.partition(";")
+    params = {}
+    if rest:
+        for part in rest.split(";"):
+            k, _, v = part.partition("=")
+            params[k.strip()] = v.strip()
+    return name.strip(), params
+
+
+_DATE_FORMATS = {
+    "yyyy-M-d H:m:S": "%Y-%m-%d %H:%M:%S",
+    "yyyy-M-d": "%Y-%m-%d",
+    "H:m:S": "%H:%M:%S"
+}
+
+
+def _decode_datetime(name, params, text, context):
+    fmt = params.get("format", "yyyy-M-d H:m:S")
+    value = datetime.datetime.strptime(text, _DATE_FORMATS.get(fmt, fmt))
+    if fmt == "yyyy-M-d":
+        return value.date()
+    elif fmt == "H:m:S":
+        return value.time()
+    return value
+
+
+def _decode_bool(name, params, text, context):
+    return text.strip().lower() == "true"
+
+
+def _register_builtin_codecs():
+    register_codec(str, Codec("str", lambda v, c, k: ("str", v), lambda n, p, t, c: t))
+    register_codec(object, Codec("str", lambda v, c, k: ("str", str(v))))
+    register_codec(bool, Codec("bool", lambda v, c, k: ("bool", "true" if v else "false"), _decode_bool))
+    register_codec(int, Codec("int", lambda v, c, k: ("int", str(v)), lambda n, p, t, c: int(t)))
+    register_codec(float, Codec("real", lambda v, c, k: ("real", repr(v)), lambda n, p, t, c: float(t)))
+    register_codec(decimal.Decimal, Codec("real", lambda v, c, k: ("real", str(v))))
+    register_codec(datetime.datetime, Codec("datetime", lambda v, c, k: (
+        "datetime;format=yyyy-M-d H:m:S",
+        "%04d-%02d-%02d %02d:%02d:%02d" % (v.year, v.month, v.day, v.hour, v.minute, v.second)), _decode_datetime))
+    register_codec(datetime.date, Codec("datetime", lambda v, c, k: (
+        "datetime;format=yyyy-M-d", "%04d-%02d-%02d" % (v.year, v.month, v.day))))
+    register_codec(datetime.time, Codec("datetime", lambda v, c, k: (
+        "datetime;format=H:m:S", "%02d:%02d:%02d" % (v.hour, v.minute, v.second))))
+    register_codec(list, Codec("str", lambda v, c, k: ("str", ";".join(v))))
+    register_codec(tuple, Codec("str", lambda v, c, k: ("str", ";".join(v))))
+    register_codec(set, Codec("str", lambda v, c, k: ("str", ";".join(sorted(v)))))
+    register_codec(frozenset, Codec("str", lambda v, c, k: ("str", ";".join(sorted(v)))))
+    register_codec(Text, Codec("text", lambda v, c, k: (
+        "text/" + v.type + ";encoding=" + c.text_encoding, c.write_text(v, k)),
+                               lambda n, p, t, c: c.read_text(t, n[5:], p["encoding"])))
+    register_codec(File, Codec("file", lambda v, c, k: (v.mime, c.write_file(v, k)),
+                               lambda n, p, t, c: c.read_file(t, n)))
+
+
+_register_builtin_codecs()
 
 book_workers = {}
 
@@ -278,34 +547,241 @@ def _load_builtin_worker(name):
     except ImportError:
         traceback.print_exc()
         return None
-    worker = dict(name=name, parser=mod.parse, maker=mod.make, extensions=mod.extensions)
+    worker = dict(name=name, parser=getattr(mod, "parse", None), maker=getattr(mod, "make", None),
+                  extensions=mod.extensions)
     set_worker(name, worker)
     return worker
 
 
 def parse_book(path, format=None, **kwargs):
+    """Reads book in `path` with parser of `format`(extension of `path` by default).
+
+    The file is closed by `Book.cleanup` of the returned book, or at once if parsing failed.
+    """
+
     worker = get_worker(os.path.splitext(path)[-1][1:] if not format else format)
+    if worker["parser"] is None:
+        raise YemError("unsupported parsing format: " + worker["name"])
     fp = open(path, "rb")
-    book = None
     try:
         book = worker["parser"](fp, **kwargs)
-        book.fp = fp
     except:
-        traceback.print_exc()
         fp.close()
+        raise
+    book.add_cleanup(fp.close)
     return book
 
 
-def make_book(book, path, format="pmab", **kwargs):
+def make_book(book, path, format="pmab", transform=None, transform_workers=0, **kwargs):
+    """Writes `book` to `path` in `format`.
+
+    `path` is a file path, a directory or a writable binary stream(seeking is
+    not required). The book is written to a temporary file and renamed to the
+    target path when done, so an existing book is never left half-written.
+
+    `transform` is a stage of `yem.transforms` applied to chapter texts while
+    writing, with `transform_workers` threads transforming texts in advance.
+    """
+
     worker = get_worker(format)
+    if worker["maker"] is None:
+        raise YemError("unsupported making format: " + worker["name"])
+    if transform is not None:
+        from .transforms import transform_book
+        view = transform_book(book, transform, transform_workers)
+        try:
+            return make_book(view, path, format, **kwargs)
+        finally:
+            view.cleanup()
+    if hasattr(path, "write"):
+        worker["maker"](book, path, **kwargs)
+        return path
     if os.path.isdir(path):
         path = os.path.join(path, book.title + os.extsep + worker["extensions"][0])
     else:
         if not os.path.splitext(path)[-1]:
             path += os.extsep + worker["extensions"][0]
-    with open(path, "wb") as fp:
+    with atomic_output(path) as fp:
         worker["maker"](book, fp, **kwargs)
     return path
 
 
-__all__ = ["YemError", "Chapter", "Book", "parse_book", "make_book"]
+def _read_umask():
+    mask = os.umask(0)
+    os.umask(mask)
+    return mask
+
+
+# umask is process-wide, it's never changed after import as makers run in many threads
+_UMASK = _read_umask()
+
+
+def _umask():
+    """Returns the current umask from /proc if available, otherwise the umask at import."""
+
+    try:
+        with open("/proc/self/status") as fp:
+            for line in fp:
+                if line.startswith("Umask:"):
+                    return int(line.split()[1], 8)
+    except OSError:
+        pass
+    return _UMASK
+
+
+@contextlib.contextmanager
+def atomic_output(path):
+    """Opens temporary file for writing, which is renamed to `path` if no error occurred."""
+
+    directory, name = os.path.split(os.path.abspath(path))
+    fd, tmp = tempfile.mkstemp(suffix=".tmp", prefix="." + name + ".", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as fp:
+            yield fp
+            fp.flush()
+            os.fsync(fp.fileno())
+        if os.path.exists(path):
+            shutil.copymode(path, tmp)
+        else:
+            # mode of new file by the umask
+            os.chmod(tmp, 0o666 & ~_umask())
+        os.replace(tmp, path)
+    except:
+        os.remove(tmp)
+        raise
+
+
+def merge_books(books, title=None, sections=False):
+    """Merges `books` to one book sharing their content, see `Chapter.derive`.
+
+    Attributes and extensions of the merged book are layered over those of `books`,
+    earlier books first. Chapters of all books are joined, or each book becomes
+    a section if `sections` is `True`.
+    """
+
+    books = list(books)
+    if not books:
+        raise ValueError("'books' require at least one book")
+    merged = books[0].derive()
+    merged._layer_(*books[1:])
+    merged._layer_extensions_(*books[1:])
+    if sections:
+        merged._set_children_([])
+        for book in books:
+            merged.append(book.derive(Chapter))
+    else:
+        merged._set_children_([ch for book in books for ch in book])
+    if title is not None:
+        merged.title = title
+    return merged
+
+
+def make_books(book, targets, workers=None):
+    """Writes `book` to many targets in one pass.
+
+    `targets` is sequence of `(path, format)` or `(path, format, options)`.
+    The chapter tree is walked once, and content of each text and file is
+    decoded or fetched once and shared by makers of all targets running
+    concurrently. Returns list of written paths in order of `targets`.
+    """
+
+    targets = [(t[0], t[1], t[2] if len(t) > 2 else {}) for t in targets]
+    for path, format, options in targets:
+        if get_worker(format)["maker"] is None:
+            raise YemError("unsupported making format: " + format)
+    shared = Book()
+    shared.clear_attributes()
+    _share_chapter(book, shared, len(targets))
+    for k, v in book.extension_items:
+        shared.set_extension(k, _share_value(v, len(targets)))
+    with concurrent.futures.ThreadPoolExecutor(workers or len(targets)) as executor:
+        futures = [executor.submit(make_book, shared, path, format, **options) for path, format, options in targets]
+        return [f.result() for f in futures]
+
+
+def _share_chapter(chapter, shared, consumers):
+    shared.update_attributes({k: _share_value(v, consumers) for k, v in chapter.attribute_items})
+    shared.text = _share_value(chapter.text, consumers)
+    for sub in chapter:
+        ch = Chapter()
+        _share_chapter(sub, ch, consumers)
+        shared.append(ch)
+
+
+def _share_value(v, consumers):
+    if isinstance(v, Text):
+        return _SharedText(v, consumers)
+    elif isinstance(v, File):
+        return _SharedFile(v, consumers)
+    else:
+        return v
+
+
+class _Shared(object):
+    """Content loaded once and released after read by all consumers."""
+
+    def __init__(self, consumers):
+        self.__consumers = consumers
+        self.__reads = 0
+        self.__values = {}
+        self.__lock = threading.RLock()
+
+    def _load_(self, key, loader, count=True):
+        with self.__lock:
+            if key in self.__values:
+                value = self.__values[key]
+            else:
+                value = self.__values[key] = loader()
+            if count:
+                self.__reads += 1
+                if self.__reads >= self.__consumers:
+                    self.__values.clear()
+            return value
+
+
+class _SharedText(Text):
+    def __init__(self, text, consumers):
+        super(_SharedText, self).__init__(text.type)
+        self.__text = text
+        self.__shared = _Shared(consumers)
+
+    @property
+    def text(self):
+        return self.__shared._load_(None, lambda: self.__text.text)
+
+    @property
+    def encoding(self):
+        # lets makers write raw bytes of the source
+        return getattr(self.__text, "encoding", None)
+
+    @property
+    def file(self):
+        return getattr(self.__text, "file", None)
+
+    def encode(self, encoding):
+        return self.__shared._load_(encoding, lambda: self.__encode(encoding))
+
+    def __encode(self, encoding):
+        if same_encoding(getattr(self.__text, "encoding", None), encoding):
+            # raw bytes of source file
+            return self.__text.encode(encoding)
+        return self.__shared._load_(None, lambda: self.__text.text, False).encode(encoding)
+
+
+class _SharedFile(File):
+    def __init__(self, file, consumers):
+        super(_SharedFile, self).__init__(file.mime)
+        self.__file = file
+        self.__shared = _Shared(consumers)
+
+    @property
+    def name(self):
+        return self.__file.name
+
+    @property
+    def data(self):
+        return self.__shared._load_(None, lambda: self.__file.data)
+
+
+__all__ = ["YemError", "Chapter", "Book", "Codec", "register_codec", "get_codec", "encode_value", "decode_value",
+           "parse_book", "make_book", "make_books", "merge_books"]
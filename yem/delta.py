@@ -0,0 +1,263 @@
+#
+# Copyright 2014-2016 Peng Wan <phylame@163.com>
+#
+# This file is part of Yem.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""Delta packages between versions of PMAB archives"""
+
+import json
+import difflib
+import zipfile
+from . import archive, core
+from .core import *
+from . import version
+
+__version__ = version.VERSION
+__author__ = version.AUTHOR
+del version
+
+MIME_FILE = "mimetype"
+MT_DELTA = b"application/pmab-delta+zip"
+MANIFEST_FILE = "delta.json"
+# directory of changed members in the package
+MEMBER_DIR = "members/"
+DELTA_VERSION = 1
+
+# sources of members in the new archive
+FROM_BASE = "base"
+FROM_DELTA = "delta"
+
+
+class Delta(object):
+    """Changes from the base archive to the new one.
+
+    `members` lists entries of all members of the new archive in order, each is
+    copied from the base archive or carried by the delta. `chapters` describes
+    changed chapters and attributes by path of chapter indexes.
+    """
+
+    def __init__(self, members, chapters, comment=b"", data=None):
+        self.members = members
+        self.chapters = chapters
+        self.comment = comment
+        # compressed bytes of members carried by the delta
+        self.data = data or {}
+
+    @property
+    def size(self):
+        return sum(len(raw) for raw in self.data.values())
+
+    def save(self, file):
+        """Writes the delta package to `file`."""
+
+        with zipfile.ZipFile(file, "w", zipfile.ZIP_DEFLATED) as zf:
+            archive.write_raw(zf, _new_info(MIME_FILE, zipfile.ZIP_STORED), *archive.compress(MT_DELTA, zipfile.ZIP_STORED))
+            manifest = {"version": DELTA_VERSION, "comment": self.comment.decode("latin-1"),
+                        "members": self.members, "chapters": self.chapters}
+            zf.writestr(_new_info(MANIFEST_FILE, zipfile.ZIP_DEFLATED), json.dumps(manifest, ensure_ascii=False))
+            for entry in self.members:
+                if entry["source"] == FROM_DELTA:
+                    # kept compressed as in the new archive
+                    zinfo = _new_info(MEMBER_DIR + entry["name"], entry["compress_type"])
+                    archive.write_raw(zf, zinfo, entry["crc"], entry["size"], self.data[entry["name"]])
+
+    @staticmethod
+    def load(file):
+        with zipfile.ZipFile(file) as zf:
+            if zf.read(MIME_FILE) != MT_DELTA:
+                raise YemError("not PMAB delta package")
+            manifest = json.loads(zf.read(MANIFEST_FILE).decode("utf-8"))
+            if manifest["version"] > DELTA_VERSION:
+                raise YemError("unsupported delta version: {0}".format(manifest["version"]))
+            data = {}
+            for entry in manifest["members"]:
+                if entry["source"] == FROM_DELTA:
+                    data[entry["name"]] = archive.read_raw(zf, zf.getinfo(MEMBER_DIR + entry["name"]))
+        return Delta(manifest["members"], manifest["chapters"], manifest["comment"].encode("latin-1"), data)
+
+    def __repr__(self):
+        return "Delta@{0}:members={1},chapters={2},size={3}".format(id(self), len(self.members),
+                                                                     len(self.chapters), self.size)
+
+
+def diff(old, new, patch=None):
+    """Compares PMAB archive file `new` with `old`, returns the `Delta`.
+
+    Members are compared with CRC and size in the central directory, so unchanged
+    and renamed members are found without decompression. Changed members are carried
+    compressed as they are. The delta package is written to `patch` if specified.
+    """
+
+    with zipfile.ZipFile(old) as base, zipfile.ZipFile(new) as target:
+        members, data = diff_members(base, target)
+        comment = target.comment
+    base = core.parse_book(old, "pmab")
+    try:
+        target = core.parse_book(new, "pmab")
+    except:
+        base.cleanup()
+        raise
+    chapters = diff_chapters(base, target)
+    delta = Delta(members, chapters, comment, data)
+    if patch is not None:
+        delta.save(patch)
+    return delta
+
+
+def diff_members(base, target):
+    digests = {}
+    for zinfo in base.infolist():
+        digests.setdefault((zinfo.CRC, zinfo.file_size), zinfo.filename)
+    members = []
+    data = {}
+    for zinfo in target.infolist():
+        if zinfo.flag_bits & 0x1:
+            raise YemError("encrypted member is unsupported: {0}".format(zinfo.filename))
+        entry = {"name": zinfo.filename, "crc": zinfo.CRC, "size": zinfo.file_size,
+                 "compress_type": zinfo.compress_type, "date_time": list(zinfo.date_time),
+                 "external_attr": zinfo.external_attr}
+        old = base.NameToInfo.get(zinfo.filename)
+        if old is not None and (old.CRC, old.file_size) == (zinfo.CRC, zinfo.file_size):
+            name = zinfo.filename
+        else:
+            name = digests.get((zinfo.CRC, zinfo.file_size))
+        if name is not None:
+            entry["source"] = FROM_BASE
+            entry["from"] = name
+        else:
+            entry["source"] = FROM_DELTA
+            data[zinfo.filename] = archive.read_raw(target, zinfo)
+        members.append(entry)
+    return members, data
+
+
+def diff_chapters(old, new):
+    """Returns list of changed chapters between `old` and `new`.
+
+    Sub-chapters are matched with title and text, so inserted or removed chapters
+    do not make the following ones changed. Each change has `path` of indexes in `new`,
+    removed chapters have `from` of indexes in `old` instead.
+    """
+
+    changes = []
+    try:
+        _diff_chapter(old, new, "", "", changes)
+    finally:
+        old.cleanup()
+        new.cleanup()
+    return changes
+
+
+def _diff_chapter(old, new, old_path, path, changes):
+    attributes = {}
+    for name, value in new.attribute_items:
+        if not old.has_attribute(name) or _digest(old.get_attribute(name)) != _digest(value):
+            attributes[name] = _describe(value)
+    removed = [name for name in old.attribute_names if not new.has_attribute(name)]
+    text = _digest(old.text) != _digest(new.text)
+    if attributes or removed or text:
+        change = {"path": path, "op": "change", "attributes": attributes, "removed": removed}
+        if text:
+            change["text"] = _describe(new.text)
+        changes.append(change)
+    olds, news = list(old), list(new)
+    matcher = difflib.SequenceMatcher(None, [_key(c) for c in olds], [_key(c) for c in news], False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        # replaced chapters are compared in pairs
+        n = min(i2 - i1, j2 - j1) if tag in ("equal", "replace") else 0
+        for k in range(n):
+            _diff_chapter(olds[i1 + k], news[j1 + k], _join(old_path, i1 + k), _join(path, j1 + k), changes)
+        for i in range(i1 + n, i2):
+            changes.append({"from": _join(old_path, i), "op": "remove"})
+        for j in range(j1 + n, j2):
+            changes.append({"path": _join(path, j), "op": "add", "attributes": _attributes(news[j]),
+                            "text": _describe(news[j].text), "size": len(news[j])})
+
+
+def _join(path, index):
+    return path + "/" + str(index) if path else str(index)
+
+
+def _key(chapter):
+    return chapter.get_attribute("title"), _digest(chapter.text)
+
+
+def _member(value):
+    file = getattr(value, "file", value)
+    return getattr(file, "member", None) if getattr(file, "archive", None) is not None else None
+
+
+def _digest(value):
+    # content in archive is compared with CRC of the member
+    member = _member(value)
+    if member is not None:
+        return member.CRC, member.file_size
+    return value
+
+
+def _describe(value):
+    member = _member(value)
+    if member is not None:
+        return {"member": member.filename}
+    elif value is None:
+        return None
+    return list(encode_value(value))
+
+
+def _attributes(chapter):
+    return {name: _describe(value) for name, value in chapter.attribute_items}
+
+
+def _new_info(name, compress_type, date_time=archive.EPOCH_TIME):
+    zinfo = zipfile.ZipInfo(name, tuple(date_time))
+    zinfo.compress_type = compress_type
+    zinfo.external_attr = 0o600 << 16
+    return zinfo
+
+
+def apply_patch(old, patch, path):
+    """Rebuilds the new archive from archive `old` and delta `patch`, writes it to `path`.
+
+    `patch` is a `Delta` or path of the delta package. Members are copied without
+    decompression, `YemError` is raised if `old` is not the base of the delta.
+    """
+
+    delta = patch if isinstance(patch, Delta) else Delta.load(patch)
+    if isinstance(path, str):
+        with core.atomic_output(path) as fp:
+            _apply(old, delta, fp)
+    else:
+        _apply(old, delta, path)
+
+
+def _apply(old, delta, file):
+    with zipfile.ZipFile(old) as base, zipfile.ZipFile(file, "w") as zf:
+        zf.comment = delta.comment
+        for entry in delta.members:
+            zinfo = _new_info(entry["name"], entry["compress_type"], entry["date_time"])
+            zinfo.external_attr = entry["external_attr"]
+            if entry["source"] == FROM_BASE:
+                src = base.NameToInfo.get(entry["from"])
+                if src is None or (src.CRC, src.file_size) != (entry["crc"], entry["size"]):
+                    raise YemError("mismatched base member: {0}".format(entry["from"]))
+                zinfo.compress_type = src.compress_type
+                raw = archive.read_raw(base, src)
+            else:
+                raw = delta.data[entry["name"]]
+            archive.write_raw(zf, zinfo, entry["crc"], entry["size"], raw)
+
+
+__all__ = ["Delta", "diff", "apply_patch"]
@@ -15,4 +15,12 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 #
-"""ePub support for Yem"""
+"""
+ePub support for Yem
+
+Only making of ePub 3 books (with NCX for old readers) is supported now.
+"""
+
+from .maker import *
+
+extensions = ("epub",)
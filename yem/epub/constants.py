@@ -0,0 +1,54 @@
+#
+# Copyright 2014-2016 Peng Wan <phylame@163.com>
+#
+# This file is part of Yem.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import yem
+import zipfile
+
+# MIME type for ePub
+MIME_FILE = "mimetype"
+MT_EPUB = b"application/epub+zip"
+
+# OCF container
+CONTAINER_FILE = "META-INF/container.xml"
+CONTAINER_XML_NS = "urn:oasis:names:tc:opendocument:xmlns:container"
+
+# package documents
+OPF_FILE = "OEBPS/content.opf"
+OPF_XML_NS = "http://www.idpf.org/2007/opf"
+DC_XML_NS = "http://purl.org/dc/elements/1.1/"
+NCX_FILE = "OEBPS/toc.ncx"
+NCX_XML_NS = "http://www.daisy.org/z3986/2005/ncx/"
+NAV_FILE = "OEBPS/nav.xhtml"
+XHTML_XML_NS = "http://www.w3.org/1999/xhtml"
+OPS_XML_NS = "http://www.idpf.org/2007/ops"
+
+# media types in manifest
+MT_XHTML = "application/xhtml+xml"
+MT_NCX = "application/x-dtbncx+xml"
+
+# keys of maker configurations
+KEY_COMMENT = "epub.comment"
+DEFAULT_COMMENT = "generated by {0} v{1}".format(yem.version.NAME, yem.version.VERSION)
+
+# make configurations
+OPS_DIR = "OEBPS"
+TEXT_DIR = "text"
+IMAGE_DIR = "images"
+EXTRA_DIR = "extras"
+ZIP_COMPRESSION = zipfile.ZIP_DEFLATED
+XML_ENCODING = "UTF-8"
@@ -0,0 +1,318 @@
+#
+# Copyright 2014-2016 Peng Wan <phylame@163.com>
+#
+# This file is part of Yem.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import re
+import os
+import tempfile
+import time
+import uuid
+from html.parser import HTMLParser
+from xml.sax.saxutils import escape, quoteattr
+
+from yem import archive
+from .constants import *
+
+
+def make(book, file, **kwargs):
+    with zipfile.ZipFile(file, "w", ZIP_COMPRESSION) as zf:
+        zf.comment = kwargs.get(KEY_COMMENT, DEFAULT_COMMENT).encode(yem.PLATFORM_ENCODING)
+        # the mimetype must be the first member stored without compression and data descriptor
+        zinfo = zipfile.ZipInfo(MIME_FILE, time.localtime()[:6])
+        archive.write_raw(zf, zinfo, *archive.compress(MT_EPUB, zipfile.ZIP_STORED))
+        zf.writestr(CONTAINER_FILE, container_xml())
+        with Package(zf) as pkg:
+            write_cover(pkg, book)
+            for index, chapter in enumerate(book):
+                write_chapter(pkg, chapter, str(index + 1), 1)
+            pkg.finish(book)
+
+
+class Package(object):
+    """Streams chapters into the archive and collects the navigation documents.
+
+    Each chapter is rendered and written when visited, so one rendered chapter
+    is kept in memory at a time. Manifest, spine and TOC entries are spooled
+    into temporary files as the chapter tree is walked.
+    """
+
+    def __init__(self, zf):
+        self.zf = zf
+        self.manifest = _spool()
+        self.spine = _spool()
+        self.ncx = _spool()
+        self.nav = _spool()
+        self.play_order = 0
+        self.max_depth = 0
+        self.cover = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        for spool in (self.manifest, self.spine, self.ncx, self.nav):
+            spool.close()
+
+    def add_item(self, id, href, media_type, properties=None, linear=None):
+        self.manifest.write('<item id={0} href={1} media-type={2}{3}/>'.format(
+            quoteattr(id), quoteattr(href), quoteattr(media_type),
+            ' properties=' + quoteattr(properties) if properties else ''))
+        if linear is not None:
+            self.spine.write('<itemref idref={0}{1}/>'.format(quoteattr(id), '' if linear else ' linear="no"'))
+
+    def write(self, href, data):
+        self.zf.writestr(OPS_DIR + "/" + href, data)
+
+    def open_nav(self, id, href, title, depth, section):
+        self.play_order += 1
+        self.max_depth = max(self.max_depth, depth)
+        self.ncx.write('<navPoint id={0} playOrder="{1}"><navLabel><text>{2}</text></navLabel>'
+                       '<content src={3}/>'.format(quoteattr("nav-" + id), self.play_order, escape(title),
+                                                   quoteattr(href)))
+        self.nav.write('<li><a href={0}>{1}</a>'.format(quoteattr(href), escape(title)))
+        if section:
+            self.nav.write('<ol>')
+
+    def close_nav(self, section):
+        self.ncx.write('</navPoint>')
+        self.nav.write('</ol></li>' if section else '</li>')
+
+    def finish(self, book):
+        title = book.title
+        identifier = book_identifier(book)
+        self.copy(OPF_FILE, opf_head(book, identifier, self.cover), (
+            (None, '<item id="ncx" href="toc.ncx" media-type="{0}"/>'.format(MT_NCX)),
+            (None, '<item id="nav" href="nav.xhtml" media-type="{0}" properties="nav"/>'.format(MT_XHTML)),
+            (self.manifest, '</manifest><spine toc="ncx">'),
+            (self.spine, '</spine></package>')))
+        self.copy(NCX_FILE, ncx_head(title, identifier, self.max_depth), ((self.ncx, '</navMap></ncx>'),))
+        self.copy(NAV_FILE, nav_head(title), ((self.nav, '</ol></nav></body></html>'),))
+
+    def copy(self, name, head, parts):
+        with self.zf.open(name, "w") as out:
+            out.write(head.encode(XML_ENCODING))
+            for spool, tail in parts:
+                if spool is not None:
+                    spool.seek(0)
+                    for block in iter(lambda: spool.read(64 * 1024), ""):
+                        out.write(block.encode(XML_ENCODING))
+                out.write(tail.encode(XML_ENCODING))
+
+
+def _spool():
+    return tempfile.SpooledTemporaryFile(1024 * 1024, "w+", encoding=XML_ENCODING)
+
+
+def container_xml():
+    return ('<?xml version="1.0" encoding="{0}"?>'
+            '<container version="1.0" xmlns="{1}"><rootfiles>'
+            '<rootfile full-path="{2}" media-type="application/oebps-package+xml"/>'
+            '</rootfiles></container>').format(XML_ENCODING, CONTAINER_XML_NS, OPF_FILE).encode(XML_ENCODING)
+
+
+def book_identifier(book):
+    isbn = book.isbn
+    if isbn:
+        return "urn:isbn:" + isbn
+    return uuid.uuid5(uuid.NAMESPACE_URL, "{0}/{1}".format(book.title, join_values(book.author))).urn
+
+
+def join_values(v):
+    if v is None:
+        return ""
+    elif isinstance(v, (list, tuple, set)):
+        return ", ".join(v)
+    else:
+        return str(v)
+
+
+def plain_text(v):
+    if isinstance(v, yem.Text):
+        return v.text
+    return v
+
+
+def opf_head(book, identifier, cover):
+    meta = ['<dc:identifier id="book-id">{0}</dc:identifier>'.format(escape(identifier)),
+            '<dc:title>{0}</dc:title>'.format(escape(book.title))]
+    language = book.language
+    if language:
+        meta.append('<dc:language>{0}</dc:language>'.format(escape(language.replace("_", "-"))))
+    author = book.author
+    if author:
+        for name in ((author,) if isinstance(author, str) else author):
+            meta.append('<dc:creator>{0}</dc:creator>'.format(escape(name)))
+    for name, value in (("publisher", book.publisher), ("description", plain_text(book.intro)),
+                        ("rights", book.rights), ("subject", book.genre)):
+        if value:
+            meta.append('<dc:{0}>{1}</dc:{0}>'.format(name, escape(value)))
+    keywords = book.keywords
+    if keywords:
+        for keyword in ((keywords,) if isinstance(keywords, str) else keywords):
+            meta.append('<dc:subject>{0}</dc:subject>'.format(escape(keyword)))
+    pubdate = book.pubdate
+    if pubdate is not None:
+        meta.append('<dc:date>{0}</dc:date>'.format(pubdate.strftime("%Y-%m-%d")))
+    date = book.date
+    if date is not None:
+        meta.append('<meta property="dcterms:modified">{0}</meta>'.format(date.strftime("%Y-%m-%dT%H:%M:%SZ")))
+    if cover:
+        meta.append('<meta name="cover" content="{0}"/>'.format(cover))
+    return ('<?xml version="1.0" encoding="{0}"?>'
+            '<package xmlns="{1}" version="3.0" unique-identifier="book-id">'
+            '<metadata xmlns:dc="{2}">{3}</metadata><manifest>').format(XML_ENCODING, OPF_XML_NS, DC_XML_NS,
+                                                                      "".join(meta))
+
+
+def ncx_head(title, identifier, depth):
+    return ('<?xml version="1.0" encoding="{0}"?>'
+            '<ncx xmlns="{1}" version="2005-1"><head>'
+            '<meta name="dtb:uid" content={2}/><meta name="dtb:depth" content="{3}"/>'
+            '<meta name="dtb:totalPageCount" content="0"/><meta name="dtb:maxPageNumber" content="0"/>'
+            '</head><docTitle><text>{4}</text></docTitle><navMap>').format(XML_ENCODING, NCX_XML_NS,
+                                                                          quoteattr(identifier), max(1, depth),
+                                                                          escape(title))
+
+
+def nav_head(title):
+    return ('<?xml version="1.0" encoding="{0}"?><!DOCTYPE html>'
+            '<html xmlns="{1}" xmlns:epub="{2}"><head><title>{3}</title></head><body>'
+            '<nav epub:type="toc" id="toc"><h1>{3}</h1><ol>').format(XML_ENCODING, XHTML_XML_NS, OPS_XML_NS,
+                                                                    escape(title))
+
+
+def write_cover(pkg, book):
+    cover = book.cover
+    if not isinstance(cover, yem.File):
+        return
+    href = IMAGE_DIR + "/cover" + os.path.splitext(cover.name)[1]
+    pkg.add_item("cover-image", href, cover.mime, "cover-image")
+    pkg.write(href, cover.data)
+    pkg.cover = "cover-image"
+
+
+def write_chapter(pkg, chapter, suffix, depth):
+    id = "chapter-" + suffix
+    href = TEXT_DIR + "/" + id + ".xhtml"
+    title = chapter.title
+    section = chapter.section
+    pkg.add_item(id, href, MT_XHTML, linear=True)
+    pkg.write(href, render_chapter(title, chapter.text, depth))
+    pkg.open_nav(id, href, title, depth, section)
+    for index, sub in enumerate(chapter):
+        write_chapter(pkg, sub, suffix + "-" + str(index + 1), depth + 1)
+    pkg.close_nav(section)
+
+
+def render_chapter(title, text, depth):
+    """Renders one chapter to XHTML document."""
+
+    title = escape(title)
+    parts = ['<?xml version="1.0" encoding="{0}"?><!DOCTYPE html>'
+             '<html xmlns="{1}" xmlns:epub="{2}"><head><title>{3}</title></head><body>'
+             '<h{4}>{3}</h{4}>'.format(XML_ENCODING, XHTML_XML_NS, OPS_XML_NS, title, min(depth, 6))]
+    if isinstance(text, yem.Text) and text.type == yem.Text.HTML:
+        parts.append(html_to_xhtml(text.text))
+    elif text is not None:
+        # whole text is escaped at once, blank lines and spaces around lines are dropped
+        text = escape(text.text if isinstance(text, yem.Text) else text)
+        lines = list(filter(None, map(str.strip, text.splitlines())))
+        if lines:
+            parts.append("<p>" + "</p><p>".join(lines) + "</p>")
+    parts.append("</body></html>")
+    return "".join(parts).encode(XML_ENCODING)
+
+
+# elements without content, written as empty XML elements
+VOID_ELEMENTS = frozenset(("area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "param",
+                           "source", "track", "wbr"))
+# elements dropped with their content
+SKIPPED_ELEMENTS = frozenset(("head", "script", "style", "title"))
+# document wrappers, only their content is kept
+WRAPPER_ELEMENTS = frozenset(("html", "body"))
+
+_name_re = re.compile(r"^[A-Za-z_][\w.-]*$")
+
+
+def html_to_xhtml(html):
+    """Converts HTML fragment or document to well-formed XHTML body content.
+
+    Entities are resolved, void elements are closed, unclosed elements are closed
+    at the end of their parents and stray end tags are dropped, as well as scripts,
+    event handlers and comments.
+    """
+
+    writer = _XhtmlWriter()
+    writer.feed(html)
+    writer.close()
+    return "".join(writer.parts)
+
+
+class _XhtmlWriter(HTMLParser):
+    def __init__(self):
+        super(_XhtmlWriter, self).__init__(convert_charrefs=True)
+        self.parts = []
+        self.stack = []
+        # depth of skipped elements
+        self.skipping = 0
+
+    def handle_starttag(self, tag, attrs):
+        self.start(tag, attrs, tag in VOID_ELEMENTS)
+
+    def handle_startendtag(self, tag, attrs):
+        self.start(tag, attrs, True)
+
+    def start(self, tag, attrs, empty):
+        if tag in SKIPPED_ELEMENTS:
+            if not empty:
+                self.skipping += 1
+            return
+        if self.skipping or tag in WRAPPER_ELEMENTS or not _name_re.match(tag):
+            return
+        parts = ["<", tag]
+        for name, value in attrs:
+            if _name_re.match(name) and not name.startswith("on") and name != "xmlns":
+                parts.append(" {0}={1}".format(name, quoteattr(value or "")))
+        if empty:
+            parts.append("/>")
+        else:
+            parts.append(">")
+            self.stack.append(tag)
+        self.parts.append("".join(parts))
+
+    def handle_endtag(self, tag):
+        if tag in SKIPPED_ELEMENTS:
+            self.skipping = max(0, self.skipping - 1)
+        elif self.skipping == 0 and tag in self.stack:
+            # close elements left open inside
+            while True:
+                top = self.stack.pop()
+                self.parts.append("</" + top + ">")
+                if top == tag:
+                    break
+
+    def handle_data(self, data):
+        if self.skipping == 0:
+            self.parts.append(escape(data))
+
+    def close(self):
+        super(_XhtmlWriter, self).close()
+        while self.stack:
+            self.parts.append("</" + self.stack.pop() + ">")
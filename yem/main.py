@@ -18,17 +18,92 @@
 #
 """Simple console for Yem"""
 
+import os
 import sys
-from yem.version import VERSION, AUTHOR
+import json
+import signal
+import argparse
+from yem.version import VERSION, AUTHOR, FULL_NAME, VERSION_MSG
 
 __version__ = VERSION
 __author__ = AUTHOR
 
 
 def main(argv):
+    parser = argparse.ArgumentParser(prog="yem", description=FULL_NAME)
+    parser.add_argument("-V", "--version", action="version", version=VERSION_MSG)
+    commands = parser.add_subparsers(dest="command")
+
+    verify = commands.add_parser("verify", help="check integrity of PMAB files")
+    verify.add_argument("-j", "--jobs", type=int, help="number of worker processes")
+    verify.add_argument("paths", nargs="+", metavar="PATH", help="PMAB file or directory containing them")
+
+    export = commands.add_parser("export", help="export attributes of PMAB files to columns file")
+    export.add_argument("-o", "--output", required=True, help="path of columns file")
+    export.add_argument("-f", "--field", action="append", help="attribute to export, repeatable")
+    export.add_argument("-j", "--jobs", type=int, help="number of worker processes")
+    export.add_argument("paths", nargs="+", metavar="PATH", help="PMAB file or directory containing them")
+
+    serve = commands.add_parser("serve", help="run conversion server")
+    address = serve.add_mutually_exclusive_group(required=True)
+    address.add_argument("-s", "--socket", help="path of Unix socket")
+    address.add_argument("-p", "--port", type=int, help="port on localhost")
+    serve.add_argument("-j", "--jobs", type=int, default=4, help="number of worker threads")
+    serve.add_argument("-q", "--queue", type=int, default=64, help="max jobs waiting or running")
+
+    args = parser.parse_args(argv[1:])
+    if args.command == "verify":
+        return verify_books(args)
+    elif args.command == "export":
+        return export_books(args)
+    elif args.command == "serve":
+        return serve_books(args)
     print("This yem {} by {}".format(__version__, __author__))
     return 0
 
 
+def verify_books(args):
+    """Prints report of each file as one JSON line, returns 1 if any file is broken."""
+
+    from yem import pmab
+    status = 0
+    for report in pmab.verify_all(find_files(args.paths, ".pmab"), args.jobs):
+        print(json.dumps(report, ensure_ascii=False), flush=True)
+        if not report["ok"]:
+            status = 1
+    return status
+
+
+def export_books(args):
+    from yem import columns
+    result = columns.export_attributes(find_files(args.paths, ".pmab"), args.field or columns.FIELDS, args.jobs)
+    result.save(args.output)
+    for row, error in sorted(result.errors.items()):
+        print("{0}: {1}".format(result.paths[row], error), file=sys.stderr)
+    return 1 if result.errors else 0
+
+
+def serve_books(args):
+    from yem import server
+    # stop gracefully to remove the socket
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        server.serve(args.socket or ("127.0.0.1", args.port), args.jobs, args.queue)
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+def find_files(paths, extension):
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                for name in sorted(files):
+                    if name.endswith(extension):
+                        yield os.path.join(root, name)
+        else:
+            yield path
+
+
 if __name__ == "__main__":
     sys.exit(main(sys.argv))
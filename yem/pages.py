@@ -0,0 +1,166 @@
+#
+# Copyright 2014-2016 Peng Wan <phylame@163.com>
+#
+# This file is part of Yem.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""Pagination index of texts for reading pages randomly"""
+
+import re
+import array
+import codecs
+import struct
+from .utils import *
+from . import version
+
+__version__ = version.VERSION
+__author__ = version.AUTHOR
+del version
+
+# page is filled by display width of characters
+BY_CHARS = "chars"
+# page is filled by display lines, long line is wrapped by `line_width`
+BY_LINES = "lines"
+
+PAGE_SIZE = {BY_CHARS: 1000, BY_LINES: 30}
+LINE_WIDTH = 40
+
+# CJK and other wide characters take two columns
+_wide_re = re.compile("[\u1100-\u115f\u2e80-\u303e\u3041-\u33ff\u3400-\u4dbf\u4e00-\u9fff\ua000-\ua4cf"
+                      "\uac00-\ud7a3\uf900-\ufaff\ufe30-\ufe4f\uff00-\uff60\uffe0-\uffe6]")
+
+_MAGIC = b"YPIX"
+# magic, mode, length of encoding, item size of offsets, size of text and number of offsets
+_HEADER = struct.Struct("<4sBBBxQI")
+# offsets are packed little-endian with fixed width of 4 or 8 bytes
+_OFFSET_CODES = {4: "I", 8: "Q"}
+_BY_CODES = {BY_CHARS: 0, BY_LINES: 1}
+
+
+def width(s: str) -> int:
+    """Returns display width of `s`."""
+    return len(s) + len(_wide_re.findall(s))
+
+
+class PageIndex(object):
+    """Byte offsets of pages in encoded text.
+
+    `encoding` is the codec for decoding each page, without BOM of the text.
+    """
+
+    def __init__(self, offsets, size, encoding, by=BY_CHARS):
+        self.offsets = offsets
+        self.size = size
+        self.encoding = encoding
+        self.by = by
+
+    @property
+    def pages(self):
+        return len(self.offsets)
+
+    def range(self, n):
+        """Returns byte range `(start, end)` of page `n`, starting from 0."""
+
+        return self.offsets[n], self.offsets[n + 1] if n + 1 < len(self.offsets) else self.size
+
+    def read_page(self, fp, n) -> str:
+        """Reads page `n` from binary stream `fp` of the encoded text."""
+
+        start, end = self.range(n)
+        fp.seek(start)
+        return fp.read(end - start).decode(self.encoding)
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __repr__(self):
+        return "{0}:pages={1};size={2};encoding={3}".format(class_name(self.__class__), self.pages, self.size,
+                                                          self.encoding)
+
+    def to_bytes(self) -> bytes:
+        itemsize = 4 if self.size < 1 << 32 else 8
+        encoding = self.encoding.encode("ascii")
+        count = len(self.offsets)
+        return b"".join((_HEADER.pack(_MAGIC, _BY_CODES[self.by], len(encoding), itemsize, self.size, count), encoding,
+                         struct.pack("<{0}{1}".format(count, _OFFSET_CODES[itemsize]), *self.offsets)))
+
+    @staticmethod
+    def from_bytes(b: bytes):
+        magic, by, length, itemsize, size, count = _HEADER.unpack_from(b)
+        if magic != _MAGIC:
+            raise ValueError("not page index")
+        if itemsize not in _OFFSET_CODES:
+            raise ValueError("bad item size of page index: {0}".format(itemsize))
+        pos = _HEADER.size
+        encoding = b[pos:pos + length].decode("ascii")
+        offsets = array.array("Q", struct.unpack_from("<{0}{1}".format(count, _OFFSET_CODES[itemsize]), b, pos + length))
+        return PageIndex(offsets, size, encoding, BY_CHARS if by == 0 else BY_LINES)
+
+    def save(self, path):
+        with open(path, "wb") as fp:
+            fp.write(self.to_bytes())
+
+    @staticmethod
+    def load(path):
+        with open(path, "rb") as fp:
+            return PageIndex.from_bytes(fp.read())
+
+
+def paginate(text, encoding: str, page_size: int = None, by: str = BY_CHARS, line_width: int = LINE_WIDTH):
+    """Computes page index of `text`(`Text` or `str`) encoded with `encoding`."""
+
+    if isinstance(text, str):
+        text = Text.for_string(text)
+    if page_size is None:
+        page_size = PAGE_SIZE[by]
+    encoding = codecs.lookup(encoding).name
+    encoder = codecs.getincrementalencoder(encoding)()
+    pos = len(encoder.encode(""))
+    offsets = array.array("Q", [pos])
+    used = 0
+    for line in split_lines(text.chunks()):
+        n = width(line)
+        if by == BY_LINES:
+            n = max(1, -(-width(line.rstrip("\r\n")) // line_width))
+            if used + n > page_size and used > 0:
+                offsets.append(pos)
+                used = 0
+        elif used + n > page_size:
+            # break the page inside the line
+            for c in line:
+                w = 2 if _wide_re.match(c) else 1
+                if used + w > page_size and used > 0:
+                    offsets.append(pos)
+                    used = 0
+                used += w
+                pos += len(encoder.encode(c))
+            continue
+        used += n
+        pos += len(encoder.encode(line))
+    if pos == offsets[-1] and len(offsets) > 1:
+        offsets.pop()
+    return PageIndex(offsets, pos, _body_encoding(encoding), by)
+
+
+def _body_encoding(encoding):
+    bom = "".encode(encoding)
+    if bom == codecs.BOM_UTF8:
+        return "utf-8"
+    for name in ("utf-32-le", "utf-32-be", "utf-16-le", "utf-16-be"):
+        if bom and bom == "\ufeff".encode(name):
+            return name
+    return encoding
+
+
+__all__ = ["PageIndex", "paginate"]
@@ -23,5 +23,6 @@ The default book packing type for Pem.
 
 from .maker import *
 from .parser import *
+from .verifier import *
 
 extensions = ("pmab",)
@@ -35,6 +35,19 @@ PBC_XML_NS = "http:#phylame.pw/format/pmab/pbc"
 KEY_TEXT_ENCODING = "pmab.text.encoding"
 KEY_XML_ENCODING = "pmab.xml.encoding"
 KEY_COMMENT = "pmab.comment"
+# fixed time of members and order of sets for reproducible output
+KEY_DETERMINISTIC = "pmab.deterministic"
+# directory or `yem.archive.BuildCache` for compressed members
+KEY_CACHE = "pmab.cache"
+KEY_ZIP_LEVEL = "pmab.zip.level"
+# page size and `yem.pages.BY_CHARS` or `BY_LINES` for page index of texts,
+# texts are stored uncompressed then so a page is read as a byte range
+KEY_PAGE_SIZE = "pmab.page.size"
+KEY_PAGE_BY = "pmab.page.by"
+# max bytes of content held in memory, larger content is streamed or spilled to temporary files
+KEY_MEMORY_LIMIT = "pmab.memory_limit"
+# dict updated with memory usage of the build
+KEY_REPORT = "pmab.report"
 DEFAULT_COMMENT = "generated by {0} v{1}".format(yem.version.NAME, yem.version.VERSION)
 
 # make configurations
@@ -42,5 +55,9 @@ TEXT_DIR = "text"
 IMAGE_DIR = "images"
 EXTRA_DIR = "extras"
 ZIP_COMPRESSION = zipfile.ZIP_DEFLATED
+ZIP_LEVEL = None
+PAGE_INDEX_EXTENSION = ".pages"
+# bytes read at once when streaming content
+CHUNK_SIZE = 64 * 1024
 TEXT_ENCODING = yem.PLATFORM_ENCODING
 XML_ENCODING = "UTF-8"
@@ -16,23 +16,176 @@
 # limitations under the License.
 #
 
+import codecs
 import datetime
 import os
+import tempfile
+import time
 from xml.dom import minidom
 
+from yem import archive, pages, values
 from .constants import *
+from .parser import page_index_path
 
 
 def make(book, file, **kwargs):
     text_encoding = kwargs.get(KEY_TEXT_ENCODING, TEXT_ENCODING)
     xml_encoding = kwargs.get(KEY_XML_ENCODING, XML_ENCODING)
-    with zipfile.ZipFile(file, "w", zipfile.ZIP_DEFLATED) as zf:
+    cache = kwargs.get(KEY_CACHE)
+    if isinstance(cache, str):
+        cache = archive.BuildCache(cache)
+    with zipfile.ZipFile(file, "w", ZIP_COMPRESSION) as zf:
         zf.comment = kwargs.get(KEY_COMMENT, DEFAULT_COMMENT).encode(yem.PLATFORM_ENCODING)
+        zf = Archive(zf, kwargs.get(KEY_DETERMINISTIC, False), cache, kwargs.get(KEY_ZIP_LEVEL, ZIP_LEVEL))
+        zf.page_size = kwargs.get(KEY_PAGE_SIZE)
+        zf.page_by = kwargs.get(KEY_PAGE_BY, pages.BY_CHARS)
+        limit = kwargs.get(KEY_MEMORY_LIMIT)
+        if limit is not None:
+            zf.budget = yem.MemoryBudget(limit)
         zf.writestr(MIME_FILE, MT_PMAB)
         # pbm
         write_pbm(zf, book, text_encoding, xml_encoding)
         # pbc
         write_pbc(zf, book, text_encoding, xml_encoding)
+    report = kwargs.get(KEY_REPORT)
+    if report is not None:
+        report["members.copied"] = zf.copied
+    if report is not None and zf.budget is not None:
+        report.update({"memory.limit": zf.budget.limit, "memory.high_water": zf.budget.high_water,
+                       "memory.streamed": zf.streamed, "memory.spilled": zf.spilled})
+
+
+class Archive(object):
+    """Writes members to the ZIP file with maker configurations."""
+
+    def __init__(self, zf, deterministic, cache, level):
+        self.zf = zf
+        self.date_time = archive.fixed_time() if deterministic else None
+        self.cache = cache
+        self.level = level
+        self.page_size = None
+        self.page_by = None
+        self.budget = None
+        self.streamed = 0
+        self.spilled = 0
+        self.copied = 0
+
+    def new_info(self, name):
+        zinfo = zipfile.ZipInfo(name, self.date_time or time.localtime()[:6])
+        zinfo.compress_type = zipfile.ZIP_STORED if self.paged(name) else ZIP_COMPRESSION
+        zinfo.external_attr = 0o600 << 16
+        return zinfo
+
+    def paged(self, name):
+        """Returns `True` if member `name` is a text with page index, which is stored for reading pages."""
+        return bool(self.page_size) and name.startswith(TEXT_DIR + "/")
+
+    def writestr(self, name, data, cached=False):
+        if self.budget is not None:
+            held = self.budget.acquire(len(data))
+            try:
+                self.write_bytes(name, data, cached)
+            finally:
+                self.budget.release(held)
+        else:
+            self.write_bytes(name, data, cached)
+
+    def write_bytes(self, name, data, cached):
+        zinfo = self.new_info(name)
+        if self.budget is not None:
+            # compressed copy is held together with the data
+            if cached and self.cache is not None:
+                entry = self.cache.compress(data, zinfo.compress_type, self.level)
+            else:
+                entry = archive.compress(data, zinfo.compress_type, self.level)
+            held = self.budget.charge(len(entry[2]) if entry[2] is not data else 0)
+            try:
+                archive.write_raw(self.zf, zinfo, *entry)
+            finally:
+                self.budget.release(held)
+        elif cached and self.cache is not None:
+            archive.write_raw(self.zf, zinfo, *self.cache.compress(data, zinfo.compress_type, self.level))
+        else:
+            self.zf.writestr(zinfo, data, compresslevel=self.level)
+
+    def copy_member(self, name, file):
+        """Copies compressed bytes of archive member backing `file` without decompressing.
+
+        Returns `False` if the file is not backed by an open archive.
+        """
+
+        src = getattr(file, "archive", None)
+        if src is None or not src.fp or src.mode != "r":
+            return False
+        member = file.member
+        if member.compress_type not in (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED) or member.flag_bits & 0x1:
+            return False
+        if member.compress_type != zipfile.ZIP_STORED and self.paged(name):
+            return False
+        zinfo = self.new_info(name)
+        zinfo.compress_type = member.compress_type
+        held = self.budget.acquire(member.compress_size) if self.budget is not None else 0
+        try:
+            archive.write_raw(self.zf, zinfo, member.CRC, member.file_size, archive.read_raw(src, member))
+        finally:
+            if held:
+                self.budget.release(held)
+        self.copied += 1
+        return True
+
+    def write_chunks(self, name, chunks):
+        """Writes member from iterable of bytes without holding all of them."""
+
+        zinfo = self.new_info(name)
+        zinfo._compresslevel = self.level
+        with self.zf.open(zinfo, "w") as fp:
+            for chunk in chunks:
+                fp.write(chunk)
+
+    def write_spooled(self, name, chunks, cached=False):
+        """Writes member from iterable of bytes within the memory budget.
+
+        Chunks are collected in memory while the budget allows, otherwise
+        spilled to a temporary file and copied to the member.
+        """
+
+        buf = bytearray()
+        spill = None
+        try:
+            for chunk in chunks:
+                if spill is None:
+                    if self.budget.try_acquire(len(chunk)):
+                        buf += chunk
+                        continue
+                    spill = tempfile.TemporaryFile()
+                    spill.write(buf)
+                    self.budget.release(len(buf))
+                    buf = None
+                spill.write(chunk)
+            if spill is None:
+                self.write_bytes(name, buf, cached)
+            else:
+                self.spilled += 1
+                spill.seek(0)
+                self.write_chunks(name, read_chunks(spill))
+        finally:
+            if spill is not None:
+                spill.close()
+            else:
+                self.budget.release(len(buf))
+
+    def write_stream(self, name, fp, cached=False):
+        """Writes member from binary stream, which is copied directly if larger than the available budget."""
+
+        with fp:
+            if fp.seekable():
+                size = fp.seek(0, os.SEEK_END)
+                fp.seek(0)
+                if size > self.budget.available():
+                    self.streamed += 1
+                    self.write_chunks(name, read_chunks(fp))
+                    return
+            self.write_spooled(name, read_chunks(fp), cached)
 
 
 def pretty_xml(doc, encoding):
@@ -45,11 +198,23 @@ def write_pbm(zf, book, text_encoding, xml_encoding):
     doc.appendChild(pbm)
     pbm.setAttribute('version', '3.0')
     pbm.setAttribute('xmlns', PBM_XML_NS)
-    write_items(zf, doc, pbm, 'attributes', book.attribute_items, text_encoding, "")
+    items = book.attribute_items
+    if zf.date_time is not None:
+        items = fixed_items(items, zf.date_time)
+    write_items(zf, doc, pbm, 'attributes', items, text_encoding, "")
     write_items(zf, doc, pbm, 'extensions', book.extension_items, text_encoding, "")
     zf.writestr(PBM_FILE, pretty_xml(doc, xml_encoding))
 
 
+def fixed_items(items, date_time):
+    """Replaces the default date, which is time of import, with time of deterministic archive."""
+
+    for name, value in items:
+        if name == "date" and value == values.date:
+            value = datetime.datetime(*date_time)
+        yield name, value
+
+
 def write_pbc(zf, book, text_encoding, xml_encoding):
     doc = minidom.Document()
     pbc = doc.createElement('pbc')
@@ -69,40 +234,9 @@ def write_pbc(zf, book, text_encoding, xml_encoding):
 def write_items(zf, doc, parent, name, items, encoding, prefix):
     group = doc.createElement(name)
     parent.appendChild(group)
+    context = ItemContext(zf, encoding)
     for k, v in items:
-        if isinstance(v, str):
-            type = 'str'
-            text = v
-        elif isinstance(v, yem.Text):
-            type = 'text/' + v.type + ';encoding=' + encoding
-            text = write_text(zf, v, prefix + k, encoding)
-        elif isinstance(v, yem.File):
-            type = v.mime
-            text = write_file(zf, v, prefix + k)
-        elif isinstance(v, datetime.datetime):
-            type = 'datetime;format=yyyy-M-d H:m:S'
-            text = v.strftime("%Y-%m-%d %H:%M:%S")
-        elif isinstance(v, datetime.date):
-            type = 'datetime;format=yyyy-M-d'
-            text = v.strftime("%Y-%m-%d")
-        elif isinstance(v, datetime.time):
-            type = 'datetime;format=H:m:S'
-            text = v.strftime("%H:%M:%S")
-        elif isinstance(v, bool):
-            type = 'bool'
-            text = str(v).lower()
-        elif isinstance(v, int):
-            type = 'int'
-            text = str(v)
-        elif isinstance(v, float):
-            type = 'real'
-            text = str(v)
-        elif isinstance(v, (list, tuple, set)):
-            type = "str"
-            text = ";".join(v)
-        else:
-            type = 'str'
-            text = str(v)
+        type, text = yem.encode_value(v, context, prefix + k)
         item = doc.createElement('item')
         item.setAttribute('name', k)
         item.setAttribute('type', type)
@@ -110,22 +244,69 @@ def write_items(zf, doc, parent, name, items, encoding, prefix):
         group.appendChild(item)
 
 
+class ItemContext(object):
+    """Stores text and file values of items for codecs."""
+
+    def __init__(self, zf, text_encoding):
+        self.zf = zf
+        self.text_encoding = text_encoding
+
+    def write_text(self, text, name):
+        return write_text(self.zf, text, name, self.text_encoding)
+
+    def write_file(self, file, name):
+        return write_file(self.zf, file, name)
+
+
 def write_text(zf, text, name, encoding):
     path = TEXT_DIR + '/' + name + extension_for_text(text)
-    zf.writestr(path, text.text.encode(encoding))
+    raw = yem.same_encoding(getattr(text, "encoding", None), encoding)
+    file = getattr(text, "file", None) if raw else None
+    if file is not None and zf.copy_member(path, file):
+        # kept compressed as in the source archive
+        pass
+    elif zf.budget is not None:
+        if file is not None:
+            zf.write_stream(path, file.open(), True)
+        else:
+            zf.write_spooled(path, encode_chunks(text.chunks(), encoding), True)
+    elif zf.cache is None and not raw:
+        zf.write_chunks(path, encode_chunks(text.chunks(), encoding))
+    else:
+        zf.writestr(path, text.encode(encoding), True)
+    if zf.page_size:
+        index = pages.paginate(text, encoding, zf.page_size, zf.page_by)
+        zf.writestr(page_index_path(path), index.to_bytes())
     return path
 
 
+def encode_chunks(chunks, encoding):
+    encoder = codecs.getincrementalencoder(encoding)()
+    for chunk in chunks:
+        yield encoder.encode(chunk)
+    yield encoder.encode("", True)
+
+
 def write_file(zf, file, name):
     if file.mime.startswith("image/"):
         path = IMAGE_DIR
     else:
         path = EXTRA_DIR
     path += '/' + name + os.path.splitext(file.name)[1]
-    zf.writestr(path, file.data)
+    if zf.copy_member(path, file):
+        # kept compressed as in the source archive
+        pass
+    elif zf.budget is not None:
+        zf.write_stream(path, file.open(), True)
+    else:
+        zf.writestr(path, file.data, True)
     return path
 
 
+def read_chunks(fp):
+    return iter(lambda: fp.read(CHUNK_SIZE), b"")
+
+
 def extension_for_text(text):
     if text.type == yem.Text.HTML:
         return ".html"
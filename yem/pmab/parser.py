@@ -16,6 +16,10 @@
 # limitations under the License.
 #
 
+import posixpath
+from xml.etree import ElementTree
+
+from yem import archive, pages
 from .constants import *
 
 
@@ -23,5 +27,124 @@ def is_pmab(zf):
     return zf.read(MIME_FILE) == MT_PMAB
 
 
+def page_index_path(path):
+    """Returns path of page index for the text member `path`."""
+    return EXTRA_DIR + "/" + posixpath.splitext(posixpath.basename(path))[0] + PAGE_INDEX_EXTENSION
+
+
+def read_page_index(zf, path):
+    return pages.PageIndex.from_bytes(zf.read(page_index_path(path)))
+
+
+def read_page(zf, path, n, index=None):
+    """Reads page `n` of the text member `path`, only the range of the page is decoded."""
+
+    if index is None:
+        index = read_page_index(zf, path)
+    zinfo = zf.getinfo(path)
+    if zinfo.compress_type == zipfile.ZIP_STORED and not zinfo.flag_bits & 0x1:
+        # the page is read directly, CRC of the member is not checked
+        start, end = index.range(n)
+        return archive.read_raw(zf, zinfo, start, end - start).decode(index.encoding)
+    # deflated texts are inflated from the beginning
+    with zf.open(path) as fp:
+        return index.read_page(fp, n)
+
+
 def parse(file, **kwargs):
-    pass
+    zf = zipfile.ZipFile(file)
+    try:
+        if MIME_FILE not in zf.NameToInfo or not is_pmab(zf):
+            raise yem.YemError("not PMAB archive")
+        book = yem.Book()
+        book.clear_attributes()
+        context = ItemContext(zf)
+        read_pbm(zf, book, context)
+        read_pbc(zf, book, context)
+    except:
+        zf.close()
+        raise
+    book.add_cleanup(zf.close)
+    return book
+
+
+def parse_attributes(file, names=None):
+    """Reads attributes of the book in `names`(all by default) from PBM only.
+
+    Chapters and content are not touched, items of text or file are skipped.
+    """
+
+    with zipfile.ZipFile(file) as zf:
+        if MIME_FILE not in zf.NameToInfo or not is_pmab(zf):
+            raise yem.YemError("not PMAB archive")
+        pbm = ElementTree.fromstring(zf.read(PBM_FILE))
+    attributes = {}
+    for group in pbm:
+        if local_name(group.tag) != "attributes":
+            continue
+        for item in group:
+            name = item.get("name")
+            type = item.get("type", "str")
+            if local_name(item.tag) != "item" or names is not None and name not in names or "/" in type:
+                continue
+            attributes[name] = yem.decode_value(type, item.text or "", None, name)
+    return attributes
+
+
+class ItemContext(object):
+    """Creates text and file values of items for codecs, content is read lazily from the archive."""
+
+    def __init__(self, zf):
+        self.zf = zf
+
+    def read_text(self, path, type, encoding):
+        return yem.Text.for_file(yem.File.for_archive(self.zf, path), encoding, type)
+
+    def read_file(self, path, mime):
+        return yem.File.for_archive(self.zf, path, mime)
+
+
+def local_name(tag):
+    return tag.rpartition("}")[2]
+
+
+def read_items(group, context, attributes=True):
+    items = {}
+    for item in group:
+        if local_name(item.tag) == "item":
+            name = item.get("name")
+            # attributes allowing list are split by declared types
+            items[name] = yem.decode_value(item.get("type", "str"), item.text or "", context,
+                                           name if attributes else None)
+    return items
+
+
+def read_pbm(zf, book, context):
+    pbm = ElementTree.fromstring(zf.read(PBM_FILE))
+    for group in pbm:
+        tag = local_name(group.tag)
+        if tag == "attributes":
+            book.update_attributes(read_items(group, context))
+        elif tag == "extensions":
+            for k, v in read_items(group, context, False).items():
+                book.set_extension(k, v)
+
+
+def read_pbc(zf, book, context):
+    pbc = ElementTree.fromstring(zf.read(PBC_FILE))
+    for toc in pbc:
+        if local_name(toc.tag) == "toc":
+            read_chapter(toc, book, context)
+
+
+def read_chapter(elem, chapter, context):
+    for child in elem:
+        tag = local_name(child.tag)
+        if tag == "attributes":
+            chapter.update_attributes(read_items(child, context))
+        elif tag == "content":
+            chapter.text = yem.decode_value(child.get("type"), (child.text or "").strip(), context)
+        elif tag == "chapter":
+            sub = yem.Chapter()
+            read_chapter(child, sub, context)
+            chapter.append(sub)
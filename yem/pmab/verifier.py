@@ -0,0 +1,130 @@
+#
+# Copyright 2014-2016 Peng Wan <phylame@163.com>
+#
+# This file is part of Yem.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import zlib
+import zipfile
+import concurrent.futures
+from xml.etree import ElementTree
+
+from .constants import *
+from .parser import is_pmab
+
+# bytes read at once when checking members
+CHUNK_SIZE = 256 * 1024
+
+
+def verify(path, chunk_size=CHUNK_SIZE):
+    """Checks integrity of the PMAB file `path`.
+
+    Returns report dict with keys `path`, `ok`, `errors`, `members` and `chapters`.
+    """
+
+    report = dict(path=path, ok=False, errors=[], members=0, chapters=0)
+    errors = report["errors"]
+    try:
+        zf = zipfile.ZipFile(path)
+    except (OSError, zipfile.BadZipFile) as e:
+        errors.append("bad zip: {0}".format(e))
+        return report
+    with zf:
+        names = set(zf.namelist())
+        report["members"] = len(names)
+        if MIME_FILE not in names:
+            errors.append("no member: " + MIME_FILE)
+        else:
+            try:
+                if not is_pmab(zf):
+                    errors.append("bad mime type")
+            except (zipfile.BadZipFile, zlib.error, OSError, EOFError):
+                # reported by check_member
+                pass
+        for info in zf.infolist():
+            check_member(zf, info, chunk_size, errors)
+        refs = set()
+        contents = set()
+        for name, check in ((PBM_FILE, None), (PBC_FILE, report)):
+            if name not in names:
+                errors.append("no member: " + name)
+                continue
+            try:
+                collect_references(zf, name, refs, contents, check)
+            except ElementTree.ParseError as e:
+                errors.append("bad xml: {0}: {1}".format(name, e))
+            except (zipfile.BadZipFile, zlib.error, OSError, EOFError):
+                # reported by check_member
+                pass
+        for ref in sorted((refs | contents) - names):
+            errors.append("missing member: " + ref)
+        texts = set(n for n in names if n.startswith(TEXT_DIR + "/chapter-"))
+        # texts of chapter attributes are referenced by items
+        for name in sorted(texts - refs - contents):
+            errors.append("unreferenced chapter: " + name)
+        if report.get("contents", 0) != len(texts & contents):
+            errors.append("chapter count mismatch: {0} contents, {1} texts".format(report.get("contents", 0),
+                                                                                 len(texts & contents)))
+        report.pop("contents", None)
+    report["ok"] = not errors
+    return report
+
+
+def check_member(zf, info, chunk_size, errors):
+    """Reads the member in chunks, CRC is checked by zipfile at the end."""
+
+    try:
+        with zf.open(info) as fp:
+            while fp.read(chunk_size):
+                pass
+    except (zipfile.BadZipFile, zlib.error, OSError, EOFError, NotImplementedError) as e:
+        errors.append("bad member: {0}: {1}".format(info.filename, e))
+
+
+def collect_references(zf, name, refs, contents, report):
+    """Adds members referenced by items to `refs` and by chapter contents to `contents`."""
+
+    with zf.open(name) as fp:
+        for event, elem in ElementTree.iterparse(fp):
+            tag = elem.tag.rpartition("}")[2]
+            if tag == "item":
+                if "/" in elem.get("type", "").partition(";")[0] and elem.text:
+                    refs.add(elem.text.strip())
+            elif tag == "content":
+                if elem.text:
+                    contents.add(elem.text.strip())
+                if report is not None:
+                    report["contents"] = report.get("contents", 0) + 1
+            elif tag == "chapter":
+                if report is not None:
+                    report["chapters"] += 1
+            else:
+                continue
+            elem.clear()
+
+
+def verify_all(paths, workers=None, chunk_size=CHUNK_SIZE):
+    """Checks many PMAB files with a process pool, yields reports when done."""
+
+    with concurrent.futures.ProcessPoolExecutor(workers) as executor:
+        futures = {executor.submit(verify, path, chunk_size): path for path in paths}
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                yield future.result()
+            except Exception as e:
+                yield dict(path=futures[future], ok=False, errors=["failed: {0!r}".format(e)], members=0, chapters=0)
+
+
+__all__ = ["verify", "verify_all"]
@@ -0,0 +1,341 @@
+#
+# Copyright 2014-2016 Peng Wan <phylame@163.com>
+#
+# This file is part of Yem.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""Conversion server keeping workers warm behind a local socket
+
+Requests and responses are JSON objects, one per line. Each request has
+`op` and optional `id`, the response echoes the `id` with `ok` and
+`result` or `error`. Jobs(`parse`, `metadata`, `make`, `convert`) run in
+a thread pool, `cancel` and `status` are answered at once.
+"""
+
+import os
+import json
+import stat
+import datetime
+import threading
+import itertools
+import socketserver
+import concurrent.futures
+from .core import *
+from .utils import *
+from . import core
+from . import version
+
+__version__ = version.VERSION
+__author__ = version.AUTHOR
+del version
+
+# formats loaded when the server starts
+FORMATS = ("pmab", "epub", "txt")
+WORKERS = 4
+# jobs waiting or running, more jobs are rejected as busy
+MAX_JOBS = 64
+
+
+class JobCancelled(YemError):
+    pass
+
+
+class _Job(object):
+    def __init__(self, id):
+        self.id = id
+        self.future = None
+        self.cancelled = threading.Event()
+
+
+class _CancellableWriter(object):
+    """Output stream stopping the maker when the job is cancelled."""
+
+    def __init__(self, fp, job):
+        self.__fp = fp
+        self.__job = job
+
+    def write(self, b):
+        if self.__job.cancelled.is_set():
+            raise JobCancelled("job cancelled: {0}".format(self.__job.id))
+        return self.__fp.write(b)
+
+    def __getattr__(self, item):
+        return getattr(self.__fp, item)
+
+
+class Server(object):
+    def __init__(self, workers=WORKERS, max_jobs=MAX_JOBS, formats=FORMATS):
+        self.max_jobs = max_jobs
+        self.executor = concurrent.futures.ThreadPoolExecutor(workers)
+        self.jobs = {}
+        self.lock = threading.Lock()
+        self.ids = itertools.count(1)
+        for name in formats:
+            # import workers and their modules before any request
+            core.get_worker(name)
+        self.handlers = {
+            "parse": self.parse,
+            "metadata": self.metadata,
+            "make": self.make,
+            "convert": self.convert
+        }
+
+    def handle(self, request, respond):
+        """Handles one request, `respond` is called with the response, maybe in other thread."""
+
+        id = request.get("id")
+        op = request.get("op")
+        if not is_scalar(id):
+            respond(dict(id=None, ok=False, error="bad request: id must be string or number"))
+        elif op == "ping":
+            respond(dict(id=id, ok=True, result="pong"))
+        elif op == "status":
+            with self.lock:
+                jobs = sorted(self.jobs, key=str)
+            respond(dict(id=id, ok=True, result=dict(jobs=jobs, max_jobs=self.max_jobs)))
+        elif op == "cancel":
+            respond(dict(id=id, ok=True, result=self.cancel(request.get("job"))))
+        elif op in self.handlers:
+            self.submit(id, self.handlers[op], request, respond)
+        else:
+            respond(dict(id=id, ok=False, error="unknown op: {0}".format(op)))
+
+    def submit(self, id, handler, request, respond):
+        # respond after releasing the lock, writing to slow client may block
+        error = None
+        with self.lock:
+            if id is None:
+                id = next(self.ids)
+            if id in self.jobs:
+                error = "duplicate job: {0}".format(id)
+            elif len(self.jobs) >= self.max_jobs:
+                error = "busy"
+            else:
+                job = self.jobs[id] = _Job(id)
+                job.future = self.executor.submit(self.run, job, handler, request)
+        if error is not None:
+            respond(dict(id=id, ok=False, error=error))
+            return
+        job.future.add_done_callback(lambda f: respond(self.done(job, f)))
+
+    def run(self, job, handler, request):
+        if job.cancelled.is_set():
+            raise JobCancelled("job cancelled: {0}".format(job.id))
+        return handler(request, job)
+
+    def done(self, job, future):
+        with self.lock:
+            self.jobs.pop(job.id, None)
+        if future.cancelled():
+            return dict(id=job.id, ok=False, error="cancelled")
+        e = future.exception()
+        if e is None:
+            return dict(id=job.id, ok=True, result=future.result())
+        elif isinstance(e, JobCancelled):
+            return dict(id=job.id, ok=False, error="cancelled")
+        else:
+            return dict(id=job.id, ok=False, error="{0}: {1}".format(class_name(e.__class__), e))
+
+    def cancel(self, id):
+        if not is_scalar(id):
+            return False
+        with self.lock:
+            job = self.jobs.get(id)
+        if job is None:
+            return False
+        job.cancelled.set()
+        job.future.cancel()
+        return True
+
+    def shutdown(self):
+        with self.lock:
+            jobs = list(self.jobs.values())
+        for job in jobs:
+            job.cancelled.set()
+            job.future.cancel()
+        self.executor.shutdown()
+
+    # jobs
+
+    def parse(self, request, job):
+        book = self.open_book(request)
+        try:
+            result = self.book_metadata(book)
+            result["chapters"] = [self.toc(ch) for ch in book]
+            return result
+        finally:
+            self.close_book(book)
+
+    def metadata(self, request, job):
+        book = self.open_book(request)
+        try:
+            return self.book_metadata(book)
+        finally:
+            self.close_book(book)
+
+    def make(self, request, job):
+        book = build_book(request["book"])
+        return self.write_book(book, request, job)
+
+    def convert(self, request, job):
+        book = self.open_book(request)
+        try:
+            return self.write_book(book, dict(request, path=request["target"],
+                                              format=request.get("target_format", "pmab")), job)
+        finally:
+            self.close_book(book)
+
+    @staticmethod
+    def open_book(request):
+        return core.parse_book(request["path"], request.get("format"), **request.get("options", {}))
+
+    @staticmethod
+    def close_book(book):
+        book.cleanup()
+
+    @staticmethod
+    def write_book(book, request, job):
+        path = request["path"]
+        format = request.get("format", "pmab")
+        worker = core.get_worker(format)
+        if worker["maker"] is None:
+            raise YemError("unsupported making format: " + format)
+        with core.atomic_output(path) as fp:
+            worker["maker"](book, _CancellableWriter(fp, job), **request.get("options", {}))
+        return path
+
+    @staticmethod
+    def book_metadata(book):
+        result = {k: json_value(v) for k, v in book.attribute_items}
+        result["size"] = book.size
+        return result
+
+    @staticmethod
+    def toc(chapter):
+        return dict(title=chapter.title, chapters=[Server.toc(ch) for ch in chapter])
+
+
+def is_scalar(v):
+    return v is None or isinstance(v, (str, int, float, bool))
+
+
+def json_value(v):
+    if isinstance(v, (str, int, float, bool)):
+        return v
+    elif isinstance(v, (list, tuple, set)):
+        return [json_value(x) for x in v]
+    elif isinstance(v, (datetime.date, datetime.time)):
+        return v.isoformat()
+    elif isinstance(v, Text):
+        return v.text
+    elif isinstance(v, File):
+        return v.name
+    else:
+        return str(v)
+
+
+def build_book(spec):
+    """Creates book from JSON object with attributes, `text` and `chapters`."""
+
+    book = Book()
+    _build_chapter(book, spec)
+    return book
+
+
+def _build_chapter(chapter, spec):
+    for k, v in spec.items():
+        if k == "text":
+            chapter.text = Text.for_string(v)
+        elif k == "chapters":
+            for sub in v:
+                ch = Chapter()
+                _build_chapter(ch, sub)
+                chapter.append(ch)
+        else:
+            chapter.set_attribute(k, tuple(v) if isinstance(v, list) else v)
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        lock = threading.Lock()
+
+        def respond(response):
+            data = (json.dumps(response, ensure_ascii=False) + "\n").encode("utf-8")
+            with lock:
+                try:
+                    self.wfile.write(data)
+                    self.wfile.flush()
+                except (OSError, ValueError):
+                    # client gone or stream closed
+                    pass
+
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            try:
+                request = json.loads(line.decode("utf-8"))
+                if not isinstance(request, dict):
+                    raise ValueError("object required")
+            except ValueError as e:
+                respond(dict(id=None, ok=False, error="bad request: {0}".format(e)))
+                continue
+            self.server.yem.handle(request, respond)
+
+
+class _UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class _TCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+def serve(address, workers=WORKERS, max_jobs=MAX_JOBS):
+    """Serves requests at `address`, a path of Unix socket or tuple of host and port, until interrupted."""
+
+    server = create_server(address, workers, max_jobs)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        server.yem.shutdown()
+        if isinstance(address, str):
+            remove_socket(address, False)
+
+
+def remove_socket(path, strict=True):
+    """Removes stale socket at `path`, other files are never removed."""
+
+    try:
+        mode = os.lstat(path).st_mode
+    except FileNotFoundError:
+        return
+    if stat.S_ISSOCK(mode):
+        os.remove(path)
+    elif strict:
+        raise YemError("not a socket: " + path)
+
+
+def create_server(address, workers=WORKERS, max_jobs=MAX_JOBS):
+    if isinstance(address, str):
+        remove_socket(address)
+        server = _UnixServer(address, _RequestHandler)
+    else:
+        server = _TCPServer(address, _RequestHandler)
+    server.yem = Server(workers, max_jobs)
+    return server
+
+
+__all__ = ["Server", "JobCancelled", "serve"]
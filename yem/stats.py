@@ -0,0 +1,192 @@
+#
+# Copyright 2014-2016 Peng Wan <phylame@163.com>
+#
+# This file is part of Yem.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""Word and character statistics of books"""
+
+import re
+import hashlib
+import threading
+import collections
+import concurrent.futures
+from .utils import *
+from . import version
+
+__version__ = version.VERSION
+__author__ = version.AUTHOR
+del version
+
+Statistics = collections.namedtuple("Statistics", ("words", "characters", "paragraphs"))
+Statistics.__new__.__defaults__ = (0, 0, 0)
+
+# CJK ideographs and Japanese kana, each one is counted as a word
+_CJK = "\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff"
+_cjk_re = re.compile("[" + _CJK + "]")
+_word_re = re.compile("[^\\W" + _CJK + "]+")
+
+# number of worker threads
+WORKERS = 4
+
+
+class StatisticsCache(object):
+    """Thread-safe LRU cache of statistics keyed by digest of text content."""
+
+    def __init__(self, capacity=65536):
+        self.capacity = capacity
+        self.__items = collections.OrderedDict()
+        self.__lock = threading.Lock()
+
+    def get(self, key):
+        with self.__lock:
+            stats = self.__items.get(key)
+            if stats is not None:
+                self.__items.move_to_end(key)
+            return stats
+
+    def put(self, key, stats):
+        with self.__lock:
+            self.__items[key] = stats
+            self.__items.move_to_end(key)
+            while len(self.__items) > self.capacity:
+                self.__items.popitem(False)
+
+    def clear(self):
+        with self.__lock:
+            self.__items.clear()
+
+    def __len__(self):
+        return len(self.__items)
+
+
+# shared cache for all books
+cache = StatisticsCache()
+
+
+def count(chunks) -> Statistics:
+    """Counts statistics of text given by iterable of string chunks."""
+
+    words = characters = paragraphs = 0
+    rest = ""
+    for chunk in chunks:
+        chunk = rest + chunk
+        # words and lines may be cut at end of chunk
+        end = chunk.rfind("\n") + 1
+        if end == 0:
+            rest = chunk
+            continue
+        rest = chunk[end:]
+        w, c, p = _count(chunk[:end])
+        words += w
+        characters += c
+        paragraphs += p
+    if rest:
+        w, c, p = _count(rest)
+        words += w
+        characters += c
+        paragraphs += p
+    return Statistics(words, characters, paragraphs)
+
+
+def _count(s):
+    characters = len(_cjk_re.findall(s))
+    paragraphs = sum(1 for line in s.splitlines() if line and not line.isspace())
+    return len(_word_re.findall(s)) + characters, characters, paragraphs
+
+
+def digest(text: Text) -> str:
+    """Returns digest of `text`, file-backed text is hashed with raw bytes without decoding."""
+
+    raw = _raw_digest(text)
+    if raw is not None:
+        return raw
+    h = hashlib.sha1()
+    for chunk in text.chunks():
+        h.update(chunk.encode("utf-8", "surrogatepass"))
+    return h.hexdigest()
+
+
+def _raw_digest(text):
+    encoding = getattr(text, "encoding", None)
+    file = getattr(text, "file", None)
+    if encoding is None or file is None:
+        return None
+    h = hashlib.sha1(encoding.encode("ascii", "replace") + b"\0")
+    with file.open() as fp:
+        for chunk in iter(lambda: fp.read(Text.CHUNK_SIZE), b""):
+            h.update(chunk)
+    # differs from digest of decoded string
+    return "raw:" + h.hexdigest()
+
+
+def text_statistics(text, stats_cache=None) -> Statistics:
+    """Returns statistics of `text`, which is `Text` or `str`.
+
+    Only texts not found in `stats_cache` are counted, file-backed text is not decoded for lookup.
+    """
+
+    if text is None:
+        return Statistics()
+    if isinstance(text, str):
+        text = Text.for_string(text)
+    if stats_cache is None:
+        return count(text.chunks())
+    # hashing is much cheaper than counting, so only missed texts are counted
+    key = digest(text)
+    stats = stats_cache.get(key)
+    if stats is None:
+        stats = count(text.chunks())
+    stats_cache.put(key, stats)
+    return stats
+
+
+def compute(book, workers=WORKERS, stats_cache=cache) -> Statistics:
+    """Computes statistics of all chapters in `book`.
+
+    Texts are counted by `workers` threads, `words`, `characters` and `paragraphs`
+    of each chapter and the book are set to the total of its text and sub-chapters.
+    Returns the total statistics of the book.
+    """
+
+    chapters = []
+    _collect(book, chapters)
+    if workers > 1 and len(chapters) > 1:
+        with concurrent.futures.ThreadPoolExecutor(workers) as executor:
+            results = list(executor.map(lambda ch: text_statistics(ch.text, stats_cache), chapters))
+    else:
+        results = [text_statistics(ch.text, stats_cache) for ch in chapters]
+    return _fill(book, dict(zip(map(id, chapters), results)))
+
+
+def _collect(chapter, chapters):
+    chapters.append(chapter)
+    for sub in chapter:
+        _collect(sub, chapters)
+
+
+def _fill(chapter, results):
+    words, characters, paragraphs = results[id(chapter)]
+    for sub in chapter:
+        w, c, p = _fill(sub, results)
+        words += w
+        characters += c
+        paragraphs += p
+    chapter.words = words
+    chapter.characters = characters
+    chapter.paragraphs = paragraphs
+    return Statistics(words, characters, paragraphs)
+
+
+__all__ = ["Statistics", "StatisticsCache"]
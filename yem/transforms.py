@@ -0,0 +1,213 @@
+#
+# Copyright 2014-2016 Peng Wan <phylame@163.com>
+#
+# This file is part of Yem.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""Streaming transforms of text applied when making books
+
+A stage is a callable taking an iterable of string chunks and returning an
+iterable of transformed chunks, so texts are cleaned while streaming into
+the output without copying the whole book.
+"""
+
+import re
+import threading
+import concurrent.futures
+from .core import *
+from .utils import *
+from . import version
+
+__version__ = version.VERSION
+__author__ = version.AUTHOR
+del version
+
+# chapters transformed in advance by each worker
+WINDOW = 2
+
+# full-width ASCII variants and ideographic space to half-width
+HALFWIDTH_TABLE = dict((c, c - 0xFEE0) for c in range(0xFF01, 0xFF5F))
+HALFWIDTH_TABLE[0x3000] = 0x20
+
+_BLANK = " \t\u3000"
+
+
+def pipeline(*stages):
+    """Returns stage applying `stages` in order."""
+
+    def apply(chunks):
+        for stage in stages:
+            chunks = stage(chunks)
+        return chunks
+
+    return apply
+
+
+# stage re-chunking text by lines, line separators are kept
+lines = split_lines
+
+
+def translate(table):
+    """Returns stage mapping characters with `table` of `str.translate`, e.g. Traditional to Simplified Chinese."""
+
+    def apply(chunks):
+        for chunk in chunks:
+            yield chunk.translate(table)
+
+    return apply
+
+
+def halfwidth():
+    """Returns stage converting full-width letters, digits and punctuations to half-width."""
+    return translate(HALFWIDTH_TABLE)
+
+
+def strip_lines(chars=_BLANK):
+    """Returns stage stripping `chars` around each line."""
+
+    def apply(chunks):
+        for line in lines(chunks):
+            body = line.rstrip("\r\n")
+            yield body.strip(chars) + line[len(body):]
+
+    return apply
+
+
+def drop_lines(pattern, flags=0):
+    """Returns stage removing lines matching regex `pattern`, e.g. ad lines."""
+
+    regex = re.compile(pattern, flags)
+
+    def apply(chunks):
+        for line in lines(chunks):
+            if not regex.search(line):
+                yield line
+
+    return apply
+
+
+def drop_blank_lines():
+    """Returns stage removing lines containing only blanks."""
+
+    def apply(chunks):
+        for line in lines(chunks):
+            if line.strip(_BLANK + "\r\n"):
+                yield line
+
+    return apply
+
+
+def replace(pattern, repl, flags=0):
+    """Returns stage substituting regex `pattern` with `repl` in each line."""
+
+    regex = re.compile(pattern, flags)
+
+    def apply(chunks):
+        for line in lines(chunks):
+            yield regex.sub(repl, line)
+
+    return apply
+
+
+class TransformedText(Text):
+    """Text of `source` transformed by `stage` when read."""
+
+    def __init__(self, source, stage, prefetcher=None):
+        super(TransformedText, self).__init__(source.type)
+        self.__source = source
+        self.__stage = stage
+        self.__prefetcher = prefetcher
+        self.__future = None
+        self.__lock = threading.Lock()
+        self.index = -1
+
+    @property
+    def text(self):
+        return "".join(self.chunks())
+
+    def chunks(self, size: int = Text.CHUNK_SIZE):
+        with self.__lock:
+            future, self.__future = self.__future, None
+        if self.__prefetcher is not None:
+            self.__prefetcher.reached(self.index)
+        if future is not None:
+            yield future.result()
+        else:
+            yield from self.__stage(self.__source.chunks(size))
+
+    def prefetch(self, executor):
+        with self.__lock:
+            if self.__future is None:
+                self.__future = executor.submit(lambda: "".join(self.__stage(self.__source.chunks())))
+
+
+class _Prefetcher(object):
+    """Transforms following texts with a pool when one is read."""
+
+    def __init__(self, workers, window):
+        self.executor = concurrent.futures.ThreadPoolExecutor(workers)
+        self.window = window
+        self.texts = []
+        self.done = -1
+        self.lock = threading.Lock()
+
+    def add(self, text):
+        text.index = len(self.texts)
+        self.texts.append(text)
+
+    def reached(self, index):
+        with self.lock:
+            start = max(index + 1, self.done + 1)
+            end = min(index + 1 + self.window, len(self.texts))
+            self.done = max(self.done, end - 1)
+        for i in range(start, end):
+            self.texts[i].prefetch(self.executor)
+
+    def close(self):
+        self.executor.shutdown(cancel_futures=True)
+
+
+def transform_book(book, stage, workers=0, window=WINDOW):
+    """Returns a view of `book` whose chapter texts are transformed by `stage`.
+
+    With `workers`, texts after the one being read are transformed in advance
+    by a thread pool, at most `window` for each worker. The pool is shut down by
+    `cleanup` of the returned book.
+    """
+
+    prefetcher = _Prefetcher(workers, workers * window) if workers > 0 else None
+    view = Book()
+    view.clear_attributes()
+    _transform_chapter(book, view, stage, prefetcher)
+    for k, v in book.extension_items:
+        view.set_extension(k, v)
+    if prefetcher is not None:
+        view.add_cleanup(prefetcher.close)
+    return view
+
+
+def _transform_chapter(chapter, view, stage, prefetcher):
+    view.update_attributes(chapter)
+    text = chapter.text
+    if text is not None:
+        view.text = TransformedText(text if isinstance(text, Text) else Text.for_string(text), stage, prefetcher)
+        if prefetcher is not None:
+            prefetcher.add(view.text)
+    for sub in chapter:
+        ch = Chapter()
+        _transform_chapter(sub, ch, stage, prefetcher)
+        view.append(ch)
+
+
+__all__ = ["TransformedText", "transform_book", "pipeline"]
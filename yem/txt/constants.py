@@ -0,0 +1,36 @@
+#
+# Copyright 2014-2016 Peng Wan <phylame@163.com>
+#
+# This file is part of Yem.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import yem
+
+MT_TEXT = "text/plain"
+
+# keys of parser configurations
+KEY_TEXT_ENCODING = "txt.text.encoding"
+KEY_PATTERN = "txt.pattern"
+KEY_TITLE = "txt.title"
+
+# parse configurations
+# detected from the file if not specified
+TEXT_ENCODING = None
+
+# heading of chapter, like "第十二章 xxx"
+# character class with non-ASCII characters is not allowed as the pattern is matched in encoded bytes
+PATTERN = (r"^(?:[ \t]|　)*第(?:[0-9]|０|１|２|３|４|５|６|７|８|９|"
+           r"零|〇|一|二|两|三|四|五|六|七|八|九|十|百|千|万)+"
+           r"(?:章|节|回|卷|集|部|篇)[^\r\n]*")
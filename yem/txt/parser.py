@@ -0,0 +1,111 @@
+#
+# Copyright 2014-2016 Peng Wan <phylame@163.com>
+#
+# This file is part of Yem.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import codecs
+import io
+import mmap
+import os
+import re
+
+from .constants import *
+
+
+def parse(file, **kwargs):
+    encoding = kwargs.get(KEY_TEXT_ENCODING, TEXT_ENCODING)
+    encoding = codecs.lookup(encoding if encoding else yem.detect_encoding(file)[0]).name
+    pattern = kwargs.get(KEY_PATTERN, PATTERN)
+    name = getattr(file, "name", None)
+    name = os.path.basename(name) if isinstance(name, str) else "txt"
+    book = yem.Book(title=kwargs.get(KEY_TITLE, os.path.splitext(name)[0]))
+    if "\n".encode(encoding) != b"\n":
+        # not ASCII compatible(UTF-16, UTF-32), the pattern cannot match in bytes
+        split_string(book, file.read().decode(encoding), re.compile(pattern, re.M))
+        return book
+    if encoding == "utf-8-sig":
+        encoding = "utf-8"
+    buf, close = map_file(file)
+    try:
+        split_buffer(book, file, name, buf, re.compile(pattern.encode(encoding), re.M), encoding)
+    finally:
+        close()
+    return book
+
+
+def map_file(file):
+    """Returns the buffer for content of `file` and the function to release it."""
+
+    try:
+        fd = file.fileno()
+    except (AttributeError, io.UnsupportedOperation, OSError):
+        buf = file.read()
+        return buf, lambda: None
+    if os.fstat(fd).st_size == 0:
+        return b"", lambda: None
+    mm = mmap.mmap(fd, 0, access=mmap.ACCESS_READ)
+    return mm, mm.close
+
+
+def split_buffer(book, file, name, buf, regex, encoding):
+    size = len(buf)
+    start = len(codecs.BOM_UTF8) if buf[:3] == codecs.BOM_UTF8 else 0
+    chapter = None
+    for m in regex.finditer(buf, start):
+        if chapter is None:
+            # text before first heading
+            if buf[start:m.start()].strip():
+                book.intro = block_text(file, name, start, m.start() - start, encoding)
+        else:
+            chapter.text = block_text(file, name, start, m.start() - start, encoding)
+        chapter = yem.Chapter(title=m.group().decode(encoding, "replace").strip())
+        book.append(chapter)
+        start = skip_newline(buf, m.end())
+    if chapter is None:
+        if start < size:
+            book.text = block_text(file, name, start, size - start, encoding)
+    else:
+        chapter.text = block_text(file, name, start, size - start, encoding)
+
+
+def skip_newline(buf, pos):
+    if buf[pos:pos + 2] in (b"\r\n", "\r\n"):
+        return pos + 2
+    elif buf[pos:pos + 1] in (b"\n", b"\r", "\n", "\r"):
+        return pos + 1
+    return pos
+
+
+def block_text(file, name, offset, size, encoding):
+    return yem.Text.for_file(yem.File.for_block(name, file, offset, size, MT_TEXT), encoding)
+
+
+def split_string(book, s, regex):
+    chapter = None
+    start = 0
+    for m in regex.finditer(s):
+        if chapter is None:
+            if s[:m.start()].strip():
+                book.intro = yem.Text.for_string(s[:m.start()])
+        else:
+            chapter.text = yem.Text.for_string(s[start:m.start()])
+        chapter = yem.Chapter(title=m.group().strip())
+        book.append(chapter)
+        start = skip_newline(s, m.end())
+    if chapter is None:
+        book.text = yem.Text.for_string(s)
+    else:
+        chapter.text = yem.Text.for_string(s[start:])
@@ -17,9 +17,13 @@
 #
 """Utilities for Yem"""
 
+import io
 import os
 import sys
+import codecs
 import locale
+import random
+import threading
 from . import version
 
 __version__ = version.VERSION
@@ -94,6 +98,179 @@ def with_type(o: object, clazz: (type, tuple), name: str) -> object:
     return o
 
 
+# (BOM, encoding), UTF-32 must be tested before UTF-16
+_BOMS = ((codecs.BOM_UTF8, "utf-8-sig"),
+         (codecs.BOM_UTF32_LE, "utf-32"),
+         (codecs.BOM_UTF32_BE, "utf-32"),
+         (codecs.BOM_UTF16_LE, "utf-16"),
+         (codecs.BOM_UTF16_BE, "utf-16"))
+
+
+def detect_encoding(data, sample_size: int = 4096, samples: int = 3) -> tuple:
+    """Guesses encoding of `data` from its BOM and a few samples.
+
+    `data` is bytes or a binary stream, only the first `sample_size` bytes and
+    `samples` blocks at random positions are read if the stream is seekable.
+    Returns tuple of encoding name and confidence between 0 and 1.
+    """
+
+    blocks = _sample_blocks(data, sample_size, samples)
+    head = blocks[0]
+    for bom, encoding in _BOMS:
+        if head.startswith(bom):
+            return encoding, 1.0
+    if not any(blocks):
+        return PLATFORM_ENCODING, 0.0
+    # UTF-16 without BOM has many zeros in high bytes of ASCII characters
+    even = sum(b[0::2].count(0) for b in blocks)
+    odd = sum(b[1::2].count(0) for b in blocks)
+    half = sum(len(b) for b in blocks) / 2
+    if odd > half * 0.3 and even < odd / 4:
+        return "utf-16-le", min(1.0, odd / half + 0.2)
+    if even > half * 0.3 and odd < even / 4:
+        return "utf-16-be", min(1.0, even / half + 0.2)
+    # blocks from middle of data are aligned to line start
+    lines = [head] + [b[b.find(b"\n") + 1:] for b in blocks[1:]]
+    if all(_is_utf8(b) for b in lines):
+        return "utf-8", 0.99 if any(max(b, default=0) > 0x7F for b in lines) else 0.5
+    # UTF-16 of CJK text, blocks are sampled at even positions
+    for encoding in ("utf-16-le", "utf-16-be"):
+        score = _cjk_score(blocks, encoding)
+        if score is not None and score > 0.9:
+            return encoding, score
+    score = _cjk_score(lines, "gb18030")
+    if score is not None:
+        return "gb18030", 0.5 + 0.45 * score
+    return PLATFORM_ENCODING, 0.1
+
+
+def _sample_blocks(data, sample_size, samples):
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        size = len(data)
+        read = lambda pos: bytes(data[pos:pos + sample_size])
+    elif data.seekable():
+        start = data.tell()
+        size = data.seek(0, io.SEEK_END) - start
+
+        def read(pos):
+            data.seek(start + pos)
+            return data.read(sample_size)
+    else:
+        return [data.read(sample_size)]
+    blocks = [read(0)]
+    if size > sample_size * 2:
+        # seeded by size for stable result of the same data
+        rand = random.Random(size)
+        for pos in sorted(rand.randrange(sample_size, size - sample_size, 2) for _ in range(samples)):
+            blocks.append(read(pos))
+    if not isinstance(data, (bytes, bytearray, memoryview)):
+        data.seek(start)
+    return blocks
+
+
+def _cjk_score(blocks, encoding):
+    """Returns ratio of common CJK and ASCII characters in decoded non-ASCII characters of `blocks`."""
+
+    chars = cjk = 0
+    for b in blocks:
+        try:
+            text = codecs.getincrementaldecoder(encoding)().decode(b)
+        except UnicodeDecodeError:
+            return None
+        for c in text:
+            if c > "\x7f":
+                chars += 1
+                if "\u4e00" <= c <= "\u9fff" or "\u3000" <= c <= "\u303f" or "\uff00" <= c <= "\uffef":
+                    cjk += 1
+            elif c < " " and c not in "\t\r\n":
+                # control characters are not expected in text
+                chars += 1
+    return cjk / chars if chars else 0.0
+
+
+def _is_utf8(b):
+    # skip continuation bytes of character cut by the sample
+    i = 0
+    while i < 3 and i < len(b) and 0x80 <= b[i] <= 0xBF:
+        i += 1
+    try:
+        codecs.getincrementaldecoder("utf-8")().decode(b[i:])
+    except UnicodeDecodeError:
+        return False
+    return True
+
+
+class MemoryBudget(object):
+    """Bounds bytes held in memory by cooperating workers and records the high-water mark."""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.used = 0
+        self.high_water = 0
+        self.__cond = threading.Condition()
+
+    def available(self) -> int:
+        with self.__cond:
+            return max(0, self.limit - self.used)
+
+    def try_acquire(self, n: int) -> bool:
+        with self.__cond:
+            if self.used + n > self.limit:
+                return False
+            self.__take(n)
+            return True
+
+    def acquire(self, n: int) -> int:
+        """Waits until `n` bytes are available, `n` larger than the limit waits for all.
+
+        Returns the acquired bytes to be released.
+        """
+
+        with self.__cond:
+            self.__cond.wait_for(lambda: self.used + n <= self.limit or self.used == 0)
+            self.__take(n)
+            return n
+
+    def charge(self, n: int) -> int:
+        """Counts `n` bytes already held without waiting, returns them to be released."""
+
+        with self.__cond:
+            self.__take(n)
+            return n
+
+    def release(self, n: int):
+        with self.__cond:
+            self.used -= n
+            self.__cond.notify_all()
+
+    def __take(self, n):
+        self.used += n
+        if self.used > self.high_water:
+            self.high_water = self.used
+
+
+def same_encoding(a: str, b: str) -> bool:
+    try:
+        return codecs.lookup(a).name == codecs.lookup(b).name
+    except (LookupError, TypeError):
+        return False
+
+
+def split_lines(chunks):
+    """Re-chunks iterable of text chunks by lines, line separators are kept."""
+
+    rest = ""
+    for chunk in chunks:
+        lines = (rest + chunk).splitlines(True)
+        rest = lines.pop() if lines and not lines[-1].endswith(("\n", "\r")) else ""
+        # "\r\n" may be cut by chunks
+        if lines and lines[-1].endswith("\r"):
+            rest = lines.pop() + rest
+        yield from lines
+    if rest:
+        yield rest
+
+
 class File(object):
     def __init__(self, mime):
         self.__mime = non_empty(mime, "mime")
@@ -110,6 +287,15 @@ class File(object):
     def data(self):
         raise NotImplementedError("Implementation required")
 
+    def open(self):
+        """Returns a binary stream for reading the content."""
+        return io.BytesIO(self.data)
+
+    def detect_encoding(self) -> tuple:
+        """Guesses encoding of text content, see `detect_encoding`."""
+        with self.open() as fp:
+            return detect_encoding(fp)
+
     def __repr__(self):
         return "{0};mime={1}".format(self.name, self.mime)
 
@@ -121,6 +307,11 @@ class File(object):
     def for_block(name: str, fp, offset: int, size: int, mime: str = None):
         return _BlockFile(name, fp, offset, size, mime)
 
+    @staticmethod
+    def for_archive(zf, name: str, mime: str = None):
+        """Creates file of member `name` in `zipfile.ZipFile` object `zf`."""
+        return _ArchiveFile(zf, name, mime)
+
     @staticmethod
     def for_url(url: str, mime: str = None):
         return _UrlFile(url, mime)
@@ -148,11 +339,17 @@ class _DiskFile(File):
         with open(self.__path, "rb") as fp:
             return fp.read()
 
+    def open(self):
+        return open(self.__path, "rb")
+
     def __repr__(self):
         return "file://" + super(_DiskFile, self).__repr__()
 
 
 class _BlockFile(File):
+    # the source file may be shared by blocks read in many threads
+    _lock_ = threading.Lock()
+
     def __init__(self, name, fp, offset, size, mime):
         super(_BlockFile, self).__init__(detect_mime(mime, non_empty(name, "name")))
         if not hasattr(fp, "read"):
@@ -172,13 +369,81 @@ class _BlockFile(File):
 
     @property
     def data(self):
-        self.__fp.seek(self.__offset)
-        return self.__fp.read(self.__size)
+        return self._read_(0, self.__size)
+
+    def open(self):
+        return _BlockReader(self, self.__size)
+
+    def _read_(self, pos, size):
+        with _BlockFile._lock_:
+            self.__fp.seek(self.__offset + pos)
+            return self.__fp.read(min(size, self.__size - pos))
 
     def __repr__(self):
         return "block://{0};offset={1};size={2}".format(super(_BlockFile, self).__repr__(), self.__offset, self.__size)
 
 
+class _BlockReader(io.RawIOBase):
+    def __init__(self, file, size):
+        self.__file = file
+        self.__size = size
+        self.__pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.__pos
+
+    def seek(self, pos, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            pos += self.__pos
+        elif whence == io.SEEK_END:
+            pos += self.__size
+        self.__pos = max(0, pos)
+        return self.__pos
+
+    def readinto(self, b):
+        if self.__pos >= self.__size:
+            return 0
+        data = self.__file._read_(self.__pos, len(b))
+        b[:len(data)] = data
+        self.__pos += len(data)
+        return len(data)
+
+
+class _ArchiveFile(File):
+    def __init__(self, zf, name, mime=None):
+        super(_ArchiveFile, self).__init__(detect_mime(mime, non_empty(name, "name")))
+        self.__zf = zf
+        self.__name = name
+
+    @property
+    def name(self):
+        return self.__name
+
+    @property
+    def data(self):
+        return self.__zf.read(self.__name)
+
+    @property
+    def archive(self):
+        return self.__zf
+
+    @property
+    def member(self):
+        return self.__zf.getinfo(self.__name)
+
+    def open(self):
+        return self.__zf.open(self.__name)
+
+    def __repr__(self):
+        return "zip://{0}!{1}".format(self.__zf.filename, super(_ArchiveFile, self).__repr__())
+
+
 class _UrlFile(File):
     def __init__(self, url, mime=None):
         super(_UrlFile, self).__init__(detect_mime(mime, non_empty(url, "url")))
@@ -193,6 +458,10 @@ class _UrlFile(File):
         import urllib.request
         return urllib.request.urlopen(self.__url).read()
 
+    def open(self):
+        import urllib.request
+        return urllib.request.urlopen(self.__url)
+
 
 class _ByteFile(File):
     def __init__(self, name, data, mime):
@@ -216,6 +485,9 @@ class Text(object):
     PLAIN = "plain"
     HTML = "html"
 
+    # characters of each chunk in `chunks`
+    CHUNK_SIZE = 64 * 1024
+
     def __init__(self, type=PLAIN):
         self.__type = non_empty(type, "type")
 
@@ -231,6 +503,17 @@ class Text(object):
     def lines(self):
         return self.text.splitlines()
 
+    def encode(self, encoding: str) -> bytes:
+        """Returns the text encoded with `encoding`."""
+        return self.text.encode(encoding)
+
+    def chunks(self, size: int = CHUNK_SIZE):
+        """Iterates the text in pieces of about `size` characters."""
+
+        text = self.text
+        for i in range(0, len(text), size):
+            yield text[i:i + size]
+
     def __repr__(self):
         return "{0}:{1}".format(self.__class__.__name__, self.type)
 
@@ -243,7 +526,8 @@ class Text(object):
         return _RawText(s, type)
 
     @staticmethod
-    def for_file(file: File, encoding: str = PLATFORM_ENCODING, type: str = PLAIN):
+    def for_file(file: File, encoding: str = None, type: str = PLAIN):
+        """Creates text from content of `file`, the encoding is detected if `encoding` is not specified."""
         return _FileText(file, encoding, type)
 
     @staticmethod
@@ -260,6 +544,13 @@ class _RawText(Text):
         super(_RawText, self).__init__(type)
         self.__str = non_none(str, "str")
 
+    @staticmethod
+    def _create_(str, type):
+        # without checking, for bulk building
+        text = _RawText.__new__(_RawText)
+        text.__dict__.update(_Text__type=type, _RawText__str=str)
+        return text
+
     @property
     def text(self):
         return self.__str
@@ -269,11 +560,38 @@ class _FileText(Text):
     def __init__(self, file: File, encoding: str, type: str):
         super(_FileText, self).__init__(type)
         self.__file = with_type(file, File, "file")
-        self.__encoding = encoding if encoding else encoding
+        self.__encoding = encoding
+
+    @property
+    def encoding(self):
+        if not self.__encoding:
+            self.__encoding = self.__file.detect_encoding()[0]
+        return self.__encoding
 
     @property
     def text(self):
-        return self.__file.data.decode(self.__encoding)
+        return self.__file.data.decode(self.encoding)
+
+    @property
+    def file(self):
+        return self.__file
+
+    def encode(self, encoding):
+        if same_encoding(self.encoding, encoding):
+            # no decoding for the same encoding
+            return self.__file.data
+        return super(_FileText, self).encode(encoding)
+
+    def chunks(self, size: int = Text.CHUNK_SIZE):
+        decoder = codecs.getincrementaldecoder(self.encoding)()
+        with self.__file.open() as fp:
+            for block in iter(lambda: fp.read(size), b""):
+                s = decoder.decode(block)
+                if s:
+                    yield s
+        s = decoder.decode(b"", True)
+        if s:
+            yield s
 
 
 class _HtmlText(Text):
@@ -288,5 +606,5 @@ class _HtmlText(Text):
 
 
 __all__ = ["File", "Text", "LINE_SEPARATOR", "PLATFORM_ENCODING", "MIME_MAPPING", "UNKNOWN_MIME", "get_mime",
-           "non_none",
+           "detect_encoding", "same_encoding", "split_lines", "MemoryBudget", "non_none",
            "non_empty", "class_name", "with_type"]
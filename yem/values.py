@@ -17,6 +17,7 @@
 #
 """Constants and value for Yem"""
 
+import os
 import locale
 import datetime
 from . import version
@@ -31,8 +32,9 @@ GENRES = (
 
 STATES = ("全本", "连载", "未完")
 
-# default attribute values
-date = datetime.datetime.now()
+# default attribute values, the date is fixed by SOURCE_DATE_EPOCH for reproducible builds
+date = datetime.datetime.fromtimestamp(int(os.environ["SOURCE_DATE_EPOCH"]), datetime.timezone.utc).replace(
+    tzinfo=None) if os.environ.get("SOURCE_DATE_EPOCH") else datetime.datetime.now()
 pubdate = None
 cover = None
 binding = None
@@ -49,12 +51,14 @@ translator = None
 title = ""
 pages = 0
 words = 0
+characters = 0
+paragraphs = 0
 price = 0.0
 language = locale.getdefaultlocale()[0]
 rights = "(C) {0} {1}".format(date.year, version.VENDOR)
 vendor = "{0} v{1}".format(version.NAME, version.VERSION)
 
-del version
+del version, os
 
 
 def reset(book):